@@ -14,11 +14,18 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+from . import storage
 from . import backend
+from . import compiled
 from . import sampler
+from . import tempering
+from . import collapsed
+from . import latent
 from . import model
 from . import state
+from . import diagnostics
 from . import utils
+from . import export
 from . import pbar
 
 __version__ = '0.1.0'
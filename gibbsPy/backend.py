@@ -16,6 +16,7 @@
 
 import numpy as np
 from . import state
+from . import storage as storage_policies
 
 '''
 This file sets up the Backend object that handles to data structure and storage for our gibbs sampler
@@ -27,36 +28,94 @@ class Backend(object):
     This is Backend object that will handle storing the data for our markov chains
     """
 
-    def __init__(self, random=None):
+    def __init__(self, random=None, storage=None, summary_block=10000, max_blocks=None):
         """
         Function to intilize the Backend
 
         :param random: (optional) if we want to initialize it with an already specified random_state that is istance of
         a numpy.random.Random() object class
+
+        :param storage: (optional) a storage.StoragePolicy instance or a list of them that decide at write time which
+        samples are kept (storage.Discard, storage.Thin) and where they are kept (storage.RingBuffer, storage.Reservoir).
+        Defaults to None which stores every sample
+
+        :param summary_block: (optional) the number of samples in each block of the min/max/mean/var summaries, which are
+        computed once each block is filled (see get_summary()). Defaults to 10000
+
+        :param max_blocks: (optional) the number of block summaries we keep, older blocks are dropped. Defaults to None
+        which keeps all of them, or the last 1000 with bounded storage (storage.RingBuffer, storage.Reservoir) so its
+        memory stays bounded too
         """
         # set the variable to knows if the backend has been intiitalized yet:
         self.initialized = False
 
+        if int(summary_block) <= 0:
+            raise ValueError("Summary block must be strictly positive:")
+        self.summary_block = int(summary_block)
+
+        # check and store the storage policies that are applied in save_sample
+        self.filters, self.bounded = storage_policies.as_policies(storage)
+
+        if max_blocks is None and self.bounded is not None:
+            max_blocks = 1000
+        if max_blocks is not None and int(max_blocks) <= 0:
+            raise ValueError("Max blocks must be strictly positive or None:")
+        self.max_blocks = None if max_blocks is None else int(max_blocks)
+
         # if we pass in a state then we use it as our random_state if it is a correct numpy.random.Random()
         # class instance
         if random is not None and isinstance(np.random.RandomState, random):
             self.random_state = random
 
-    def reset(self, ndim):
+    def reset(self, ndim, params=None):
         """
         This function resets and intiializes the backend whether it had been run before or not
 
         :param ndim: This is the dimension of the problem for the backend storage and is required
 
+        :param params: (optional) list of strings with the name of each parameter, used to select columns by name when
+        reading. Defaults to ['x0', ... 'x(ndim-1)']
+
         :return: This function does not return anything
         """
 
+        if params is None:
+            params = ['x%s' % i for i in range(ndim)]
+        elif len(params) != ndim:
+            raise ValueError('List of parameter names must be the same length as the dimension of the probelem or None:')
+        self.params = list(params)
+
         self.dim = ndim
         self.iteration = 0
         self.chain = np.empty((0, self.dim))
         self.random_state = None
         self.initialized = True
 
+        # nsteps counts every sample passed to save_sample, accepted counts those kept by the filtering policies and
+        # steps stores the step each row of the chain was sampled at (used to keep bounded storage in order)
+        self.nsteps = 0
+        self.accepted = 0
+        self.steps = np.empty(0, dtype=np.int64)
+        self.last_pos = np.empty(self.dim)
+
+        # min/max/mean/var of each full block of summary_block accepted samples, block b is kept in row b (or row
+        # b % max_blocks). block_fill counts the samples of the block being filled, with bounded storage they are staged
+        # in _block_buf as the chain may not keep them. The first block starts at accepted sample block_offset
+        nrows = 0 if self.max_blocks is None else self.max_blocks
+        self.nblocks = 0
+        self.block_offset = 0
+        self.block_fill = 0
+        self.block_min = np.empty((nrows, self.dim))
+        self.block_max = np.empty((nrows, self.dim))
+        self.block_mean = np.empty((nrows, self.dim))
+        self.block_var = np.empty((nrows, self.dim))
+        self._block_buf = None if self.bounded is None else np.empty((self.summary_block, self.dim))
+
+        for policy in self.filters:
+            policy.reset()
+        if self.bounded is not None:
+            self.bounded.reset()
+
     def grow(self, n):
         """
         This function grows the size of the backend data structures to be prepaared to store more data in them
@@ -65,14 +124,60 @@ class Backend(object):
 
         :return: This function does not return anything:
         """
+        # only grow by the number of samples that will make it through the filtering policies
+        for policy in self.filters:
+            n = policy.count(n)
+
+        # bounded storage never needs more than its size
+        target = self.iteration + n
+        if self.bounded is not None:
+            target = min(target, self.bounded.size)
+
         # take current length plus how much we want to grow by
-        i = n - (len(self.chain) - self.iteration)
+        i = target - len(self.chain)
+        if i <= 0:
+            return
 
         # make an empyty array of correct size
         a = np.empty((i, self.dim))
 
         # add in stuff we already have:
         self.chain = np.concatenate((self.chain, a), axis=0)
+        self.steps = np.concatenate((self.steps, np.empty(i, dtype=np.int64)))
+
+    def _close_block(self, rows):
+        """
+        This function computes the summary of a full block of samples and stores it as the next block
+
+        :param rows: numpy array of shape (summary_block, D) of the samples of the block
+
+        :return: This function does not return anything:
+        """
+        if self.max_blocks is None:
+            if self.nblocks >= len(self.block_min):
+                i = max(self.nblocks, 1)
+                for name in ('block_min', 'block_max', 'block_mean', 'block_var'):
+                    setattr(self, name, np.concatenate((getattr(self, name), np.empty((i, self.dim))), axis=0))
+            b = self.nblocks
+        else:
+            b = self.nblocks % self.max_blocks
+        self.block_min[b] = rows.min(axis=0)
+        self.block_max[b] = rows.max(axis=0)
+        self.block_mean[b] = rows.mean(axis=0)
+        self.block_var[b] = rows.var(axis=0)
+        self.nblocks += 1
+
+    def _close_blocks(self):
+        """
+        This function closes every full block of the last block_fill accepted samples, which must be the last rows of
+        self.chain (so only without bounded storage)
+
+        :return: This function does not return anything:
+        """
+        while self.block_fill >= self.summary_block:
+            start = self.accepted - self.block_fill
+            self._close_block(self.chain[start:start + self.summary_block])
+            self.block_fill -= self.summary_block
 
     def save_sample(self, state):
         """
@@ -85,14 +190,76 @@ class Backend(object):
         # Check to make sure the passed in state is an instance of the State object and is of the correct shape:
         self._check_state(state)
 
-        # add in the position of that state to our chain
-        self.chain[self.iteration, :] = state.pos
-
-        # update our random state with the last one used in the saved state object
+        # update our random state with the last one used in the saved state object and keep the last position so we
+        # can resume even if this sample is not stored
         self.random_state = state.random_state
+        self.last_pos[:] = state.pos
+        step = self.nsteps
+        self.nsteps += 1
+
+        # apply the filtering policies in order
+        for policy in self.filters:
+            if not policy.accept():
+                return
+
+        # find the row of the chain we write to
+        if self.bounded is None:
+            idx = self.accepted
+        else:
+            idx = self.bounded.slot()
+            # stage the sample for the block summaries as bounded storage may not keep it
+            self._block_buf[self.block_fill] = state.pos
+        self.accepted += 1
+
+        if idx is not None:
+            # add in the position of that state to our chain
+            self.chain[idx, :] = state.pos
+            self.steps[idx] = step
+
+            # update our iteration variable that will store the number of samples held in our backend chain
+            self.iteration = max(self.iteration, idx + 1)
+
+        # summarize the block once it is full
+        self.block_fill += 1
+        if self.block_fill == self.summary_block:
+            if self.bounded is None:
+                self._close_block(self.chain[self.accepted - self.summary_block:self.accepted])
+            else:
+                self._close_block(self._block_buf)
+            self.block_fill = 0
+
+    def direct(self):
+        """
+        This function tells us if samples can be written straight into self.chain, which is only the case if we do not
+        use any storage policies
 
-        # update our iteration variable that will store the current itration value of our backend chain
-        self.iteration += 1
+        :return: True if there are no storage policies, otherwise return False
+        """
+        return not self.filters and self.bounded is None
+
+    def save_written(self, n, state):
+        """
+        This function records n samples that were written straight into self.chain[self.iteration:self.iteration + n]
+        (e.g. by the compiled engine) instead of through save_sample
+
+        :param n: The number of samples that were written
+
+        :param state: This is the last state that was written. It must be an instance of the State object
+
+        :return: This function does not return anything:
+        """
+        if not self.direct():
+            raise ValueError("Can not write samples directly into a backend with storage policies:")
+        self._check_state(state)
+
+        self.steps[self.iteration:self.iteration + n] = np.arange(self.nsteps, self.nsteps + n)
+        self.random_state = state.random_state
+        self.last_pos[:] = state.pos
+        self.nsteps += n
+        self.accepted += n
+        self.iteration += n
+        self.block_fill += n
+        self._close_blocks()
 
     def _check_state(self, state):
         """
@@ -107,7 +274,27 @@ class Backend(object):
         if state.pos.shape != (self.dim,):
             raise ValueError("Invalid State Position dimension; expected {}".format(self.dim))
 
-    def get_attribute(self, name, discard=0, thin=1):
+    def _columns(self, params):
+        """
+        This function turns a list of parameter names (or column indices) into column indices of the chain
+
+        :param params: a parameter name or index, or a list of them
+
+        :return: returns a list of column indices
+        """
+        if isinstance(params, (str, int, np.integer)):
+            params = [params]
+        cols = []
+        for p in params:
+            if isinstance(p, str):
+                if p not in self.params:
+                    raise ValueError("Unknown parameter {}; expected one of {}".format(p, self.params))
+                cols.append(self.params.index(p))
+            else:
+                cols.append(int(p))
+        return cols
+
+    def get_attribute(self, name, discard=0, thin=1, params=None, window=None):
         """
         This function gets any attribute we want out of the backend that is stored at any iteration.
         Currently this is just the chain positions but will add more stored attributes in the future that this function
@@ -119,43 +306,105 @@ class Backend(object):
         of the stored chain values, defaults to 0
 
         :param thin: (optional) this is an optional kw arg that is the factor by which we want to thin the chain by.
-        (warning, if we thin the chain upon output and during sampling just know it might be thinned twice)
+        (warning, this is applied on top of any thinning done during sampling or by a storage.Thin policy so the chain
+        might be thinned twice)
+
+        :param params: (optional) a parameter name (or column index) or list of them to only return those columns.
+        defaults to None which returns every column
+
+        :param window: (optional) a tuple (a, b) to only look at the stored samples a to b (like chain[a:b], either may
+        be None) before discard and thin are applied. defaults to None which looks at every stored sample
 
-        :return:  This returns the output array of the desired attribute
+        :return:  This returns the output array of the desired attribute. Without storage policies or params this is a
+        view of the stored array so nothing is copied
         """
         # make sure the backend has some values stored already
         if self.iteration <= 0:
             raise AttributeError("Must run sampler and store values to retrieve attribute from the backend:")
 
+        values = getattr(self, name)
+        rows = slice(None) if window is None else slice(*window)
+        cols = None if params is None else self._columns(params)
+
+        if self.bounded is not None:
+            # bounded storage overwrites rows out of order so put them back in the order they were sampled
+            idx = np.argsort(self.steps[:self.iteration], kind='stable')[rows][discard+thin-1::thin]
+            return values[idx] if cols is None else values[np.ix_(idx, cols)]
+
         # retur the correct array with correct slicing
-        return getattr(self, name)[discard+thin-1:self.iteration:thin]
+        values = values[:self.iteration][rows][discard+thin-1::thin]
+        return values if cols is None else values[:, cols]
 
     def get_chain(self, **kwargs):
         """
         This function uses the get_attribute fct to retreive the chain.
 
         :param kwargs: These are the optional kwargs to be passed to get_attribute() method. THese are thin, and discard
-        which default to 1 and 0 respectively
+        which default to 1 and 0 respectively, and params and window to lazily read only some columns or samples
+        (e.g. get_chain(params=['x3'], window=(a, b)))
 
         :return:  returns the output array of the stored chain
         """
         return self.get_attribute("chain", **kwargs)
 
+    def get_summary(self, params=None):
+        """
+        This function returns the summaries of each block of summary_block samples, which are computed once each block
+        is full so this only reads the samples of the block still being filled. The blocks count every sample kept by
+        the filtering storage policies (Discard, Thin) in the order they were sampled, including the ones a bounded
+        policy did not keep or overwrote. Only the last max_blocks full blocks are kept, and a backend with bounded
+        storage imported with the export module only summarizes the samples accepted after it was imported
+
+        :param params: (optional) a parameter name (or column index) or list of them to only return those columns.
+        defaults to None which returns every column
+
+        :return: returns a dictionary with 'start' (the index of the first sample of each block), 'count' (the number
+        of samples in each block, only the last block can be partial) and the (nblocks, D) arrays 'min', 'max', 'mean'
+        and 'var' of each block
+        """
+        if (not self.initialized) or self.accepted <= 0:
+            raise AttributeError("Must run sampler and store values to retrieve the summary from the backend:")
+
+        cols = slice(None) if params is None else self._columns(params)
+        first = 0 if self.max_blocks is None else max(0, self.nblocks - self.max_blocks)
+        rows = np.arange(first, self.nblocks)
+        if self.max_blocks is not None:
+            rows = rows % self.max_blocks
+
+        stats = {'min': self.block_min, 'max': self.block_max, 'mean': self.block_mean, 'var': self.block_var}
+        out = {name: values[rows][:, cols] for name, values in stats.items()}
+        out['start'] = self.block_offset + np.arange(first, self.nblocks) * self.summary_block
+        out['count'] = np.full(len(rows), self.summary_block, dtype=np.int64)
+
+        # add the partial block we are still filling
+        if self.block_fill > 0:
+            if self.bounded is None:
+                part = self.chain[self.accepted - self.block_fill:self.accepted, cols]
+            else:
+                part = self._block_buf[:self.block_fill, cols]
+            part_stats = {'min': part.min(axis=0), 'max': part.max(axis=0), 'mean': part.mean(axis=0),
+                          'var': part.var(axis=0)}
+            for name, value in part_stats.items():
+                out[name] = np.concatenate((out[name], value[None]), axis=0)
+            out['start'] = np.append(out['start'], self.block_offset + self.nblocks * self.summary_block)
+            out['count'] = np.append(out['count'], self.block_fill)
+        return out
+
     def get_last_sample(self):
         """
         This function retrieves the last sample of whatever is stored and returns it as a State object instance to be
         used for resuming in the sampler
 
-        :return: returns a State object instance with position = the last sample stored in self.chain and the random
-        state whatever is stored in the backend if any
+        :return: returns a State object instance with position = the last sample passed to save_sample (whether or not
+        the storage policies kept it) and the random state whatever is stored in the backend if any
         """
 
         # make sure the backend has been ran before we try and get a sample:
-        if (not self.initialized) or self.iteration <= 0:
+        if (not self.initialized) or self.nsteps <= 0:
             raise AttributeError("Must run sampler and store values to retrieve last state from the backend:")
 
         # return the State object
-        return state.State(self.get_chain(discard=self.iteration-1)[0], random=self.random_state)
+        return state.State(np.copy(self.last_pos), random=self.random_state)
 
 
 
@@ -0,0 +1,396 @@
+# Copyright (C) 2018  Bruce Edelman
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import abc
+import numpy as np
+from . import sampler
+
+"""
+This File sets up collapsed (marginalized) Gibbs sampling for mixture and topic style models. The component parameters
+and the mixing weights are integrated out analytically and we only sample the latent assignment z_i of each data point.
+The integrated out parameters are represented by cached sufficient statistics (count tables) that are updated
+incrementally: the data point is removed from its component, the collapsed conditional is computed from the
+statistics of everything else, a new component is drawn and the data point is added back
+"""
+
+
+class SufficientStats(abc.ABC):
+    """
+    This is the abstract base class for the sufficient statistics of the integrated out component parameters
+    """
+    def __init__(self, K):
+        """
+        The initialization of the sufficient statistics
+
+        :param K: The number of components
+        """
+        self.K = int(K)
+
+    @abc.abstractmethod
+    def reset(self):
+        """
+        This function empties the statistics of every component
+
+        :return: This function does not return anything
+        """
+
+    @abc.abstractmethod
+    def add(self, x, k):
+        """
+        This function adds a data point to component k
+
+        :param x: the data point
+
+        :param k: the component
+
+        :return: This function does not return anything
+        """
+
+    @abc.abstractmethod
+    def remove(self, x, k):
+        """
+        This function removes a data point from component k
+
+        :param x: the data point
+
+        :param k: the component
+
+        :return: This function does not return anything
+        """
+
+    @abc.abstractmethod
+    def log_predictive(self, x):
+        """
+        This function computes the log posterior predictive of a data point under each component, given the data
+        currently added to them
+
+        :param x: the data point
+
+        :return: numpy array of length K
+        """
+
+
+class CountTable(SufficientStats):
+    """
+    Sufficient statistics of categorical components (e.g. the words of a topic) with a symmetric Dirichlet prior
+    """
+    def __init__(self, K, V, beta=1.):
+        """
+        The initialization of the count table
+
+        :param K: The number of components
+
+        :param V: The number of categories (e.g. the vocabulary size). Data points are integers in 0 ... V - 1
+
+        :param beta: (optional) the concentration of the Dirichlet prior of each component, defaults to 1
+        """
+        super(CountTable, self).__init__(K)
+        self.V = int(V)
+        self.beta = float(beta)
+        self.reset()
+
+    def reset(self):
+        """
+        This function empties the counts of every component
+
+        :return: This function does not return anything
+        """
+        self.counts = np.zeros((self.K, self.V))
+        self.totals = np.zeros(self.K)
+
+    def add(self, x, k):
+        """
+        This function adds a data point to the counts of component k
+
+        :param x: the data point, an integer category in 0 ... V - 1
+
+        :param k: the component
+
+        :return: This function does not return anything
+        """
+        self.counts[k, x] += 1
+        self.totals[k] += 1
+
+    def remove(self, x, k):
+        """
+        This function removes a data point from the counts of component k
+
+        :param x: the data point, an integer category in 0 ... V - 1
+
+        :param k: the component
+
+        :return: This function does not return anything
+        """
+        self.counts[k, x] -= 1
+        self.totals[k] -= 1
+
+    def log_predictive(self, x):
+        """
+        This function computes the log of the Dirichlet-categorical posterior predictive probability of category x
+        under each component
+
+        :param x: the data point, an integer category in 0 ... V - 1
+
+        :return: numpy array of length K
+        """
+        return np.log(self.counts[:, x] + self.beta) - np.log(self.totals + self.V * self.beta)
+
+
+class GaussianStats(SufficientStats):
+    """
+    Sufficient statistics of gaussian components with known width sigma and a gaussian N(mu0, tau0) prior on each mean
+    """
+    def __init__(self, K, mu0=0., tau0=1., sigma=1.):
+        """
+        The initialization of the gaussian statistics
+
+        :param K: The number of components
+
+        :param mu0: (optional) the mean of the prior on the component means, defaults to 0
+
+        :param tau0: (optional) the standard deviation of the prior on the component means, defaults to 1
+
+        :param sigma: (optional) the known standard deviation of every component, defaults to 1
+        """
+        super(GaussianStats, self).__init__(K)
+        self.mu0 = float(mu0)
+        self.tau0 = float(tau0)
+        self.sigma = float(sigma)
+        self.reset()
+
+    def reset(self):
+        """
+        This function empties the number and sum of the data points of every component
+
+        :return: This function does not return anything
+        """
+        self.n = np.zeros(self.K)
+        self.sum = np.zeros(self.K)
+
+    def add(self, x, k):
+        """
+        This function adds a data point to the number and sum of component k
+
+        :param x: the data point, a float
+
+        :param k: the component
+
+        :return: This function does not return anything
+        """
+        self.n[k] += 1
+        self.sum[k] += x
+
+    def remove(self, x, k):
+        """
+        This function removes a data point from the number and sum of component k
+
+        :param x: the data point, a float
+
+        :param k: the component
+
+        :return: This function does not return anything
+        """
+        self.n[k] -= 1
+        self.sum[k] -= x
+
+    def log_predictive(self, x):
+        """
+        This function computes the log of the gaussian posterior predictive density of a data point under each component
+
+        :param x: the data point, a float
+
+        :return: numpy array of length K
+        """
+        # posterior of each component mean is gaussian, the predictive adds the known width of the component
+        precision = 1. / self.tau0**2 + self.n / self.sigma**2
+        mean = (self.mu0 / self.tau0**2 + self.sum / self.sigma**2) / precision
+        var = 1. / precision + self.sigma**2
+        return -0.5 * (np.log(2 * np.pi * var) + (x - mean)**2 / var)
+
+
+class DirichletWeights(object):
+    """
+    The integrated out mixing weights with a symmetric Dirichlet prior. With groups this holds a separate set of weights
+    for each group (e.g. the topic proportions of each document in LDA)
+    """
+    def __init__(self, K, alpha=1., groups=None):
+        """
+        The initialization of the Dirichlet weights
+
+        :param K: The number of components
+
+        :param alpha: (optional) the concentration of the Dirichlet prior, defaults to 1
+
+        :param groups: (optional) integer array with the group of each data point. defaults to None which puts every
+        data point in a single group (a plain mixture model)
+        """
+        self.K = int(K)
+        self.alpha = float(alpha)
+        self.groups = None if groups is None else np.asarray(groups, dtype=int)
+        self.reset()
+
+    def reset(self):
+        """
+        This function empties the counts of every group
+
+        :return: This function does not return anything
+        """
+        ngroups = 1 if self.groups is None else self.groups.max() + 1
+        self.counts = np.zeros((ngroups, self.K))
+
+    def _group(self, i):
+        """
+        This function finds the group of data point i
+
+        :param i: the index of the data point
+
+        :return: returns the index of its group (0 without groups)
+        """
+        return 0 if self.groups is None else self.groups[i]
+
+    def add(self, i, k):
+        """
+        This function adds data point i to component k
+
+        :param i: the index of the data point
+
+        :param k: the component
+
+        :return: This function does not return anything
+        """
+        self.counts[self._group(i), k] += 1
+
+    def remove(self, i, k):
+        """
+        This function removes data point i from component k
+
+        :param i: the index of the data point
+
+        :param k: the component
+
+        :return: This function does not return anything
+        """
+        self.counts[self._group(i), k] -= 1
+
+    def log_prior(self, i):
+        """
+        This function computes the log of the collapsed prior probability of data point i being in each component, up
+        to a constant
+
+        :param i: the index of the data point
+
+        :return: numpy array of length K
+        """
+        return np.log(self.counts[self._group(i)] + self.alpha)
+
+
+class CollapsedSampler(sampler.Sampler):
+    """
+    This is the Sampler object that does collapsed gibbs sampling of the latent assignments of each data point
+    """
+    def __init__(self, data, likelihood, weights=None, sampling_params=None, initial_state=None, **kwargs):
+        """
+        The intialization function called when we set up an instance of our collapsed sampler object
+
+        :param data: numpy array of the data, one data point (the first axis) for each latent assignment we sample
+
+        :param likelihood: a SufficientStats instance (e.g. CountTable, GaussianStats) for the integrated out component
+        parameters
+
+        :param weights: (optional) a DirichletWeights instance for the integrated out mixing weights. defaults to
+        DirichletWeights(likelihood.K)
+
+        :param sampling_params: (Optional) This is a list of strings with the name of each latent assignment. defaults to
+        ['x0', ... 'x(N-1)']
+
+        :param initial_state: (optional) numpy array of the initial component (0 ... K - 1) of each data point. defaults
+        to None which draws them uniformly at random
+
+        :param kwargs: These are all passed to the Sampler initialization (random, back, resume, storage)
+        """
+        self.likelihood = likelihood
+        self.weights = DirichletWeights(likelihood.K) if weights is None else weights
+        if self.weights.K != self.likelihood.K:
+            raise ValueError("The weights and likelihood must have the same number of components:")
+        self.K = self.likelihood.K
+
+        # we draw the initial assignments once we have our random state
+        draw = initial_state is None
+        if draw:
+            initial_state = np.zeros(len(data))
+
+        super(CollapsedSampler, self).__init__(len(data), sampling_params=sampling_params, initial_state=initial_state,
+                                               data=data, cond_fct=self._conditional, **kwargs)
+
+        if draw and self._previous_state.pos is initial_state:
+            initial_state[:] = self._random.randint(self.K, size=self.dim)
+
+    def _build_tables(self, pos):
+        """
+        This function rebuilds the sufficient statistics from the assignments of every data point
+
+        :param pos: numpy array of the component of each data point
+
+        :return: This function does not return anything
+        """
+        self.likelihood.reset()
+        self.weights.reset()
+        for i, k in enumerate(pos.astype(int)):
+            self.likelihood.add(self.data[i], k)
+            self.weights.add(i, k)
+
+    def _conditional(self, pos, idx, data, random=None):
+        """
+        This is the collapsed conditional of the assignment of data point idx, updating the cached statistics
+
+        :param pos: numpy array of the current component of each data point
+
+        :param idx: the index of the data point we sample the assignment of
+
+        :param data: the data
+
+        :param random: the np.random.RandomState instance of the sampler
+
+        :return: returns the new component of data point idx
+        """
+        x = data[idx]
+        k = int(pos[idx])
+        self.likelihood.remove(x, k)
+        self.weights.remove(idx, k)
+
+        logp = self.weights.log_prior(idx) + self.likelihood.log_predictive(x)
+        p = np.cumsum(np.exp(logp - logp.max()))
+        k = min(int(np.searchsorted(p, random.uniform() * p[-1], side='right')), self.K - 1)
+
+        self.likelihood.add(x, k)
+        self.weights.add(idx, k)
+        return k
+
+    def sample(self, initial, n, **kwargs):
+        """
+        This is the Generator for sampling the assignments. It rebuilds the cached statistics from the initial state and
+        then runs Sampler.sample
+
+        :param initial: THis is the initial state we are in must be an instance of State object
+
+        :param n: Number of steps to evovle our chain
+
+        :param kwargs: (optional) these keyword args are passed into Sampler.sample (store, thin, progress)
+
+        :return: This is a generator so it yields the next sample at each iteration
+        """
+        self._build_tables(initial.pos)
+        return super(CollapsedSampler, self).sample(initial, n, **kwargs)
@@ -0,0 +1,116 @@
+# Copyright (C) 2018  Bruce Edelman
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import numpy as np
+try:
+    import numba
+except ImportError:
+    numba = None
+
+"""
+This File sets up the optional numba compiled engine used by Sampler.sample(engine='numba'). The whole loop over steps,
+thinning and parameters is compiled together with the conditional function and the samples are written straight into
+the backend chain array. The conditional must be numba compilable, called as cond_fct(pos, idx, data, *static_params)
+and draw its random numbers from np.random. numba keeps a separate np.random state for each thread, so every run is
+seeded inside the compiled loop from the sampler's random state. It should still take a random=None keyword argument so
+the same function runs in the pure python engine, which calls the python version of a numba decorated conditional and
+seeds the global np.random from the sampler's random state before each run so it is reproducible as well
+"""
+
+
+def _make_run(fct, dim):
+    """
+    This function builds the compiled loop for a given conditional function and dimension
+
+    :param fct: the numba compiled conditional function
+
+    :param dim: the dimension of the problem
+
+    :return: returns the compiled function run(pos, data, args, out, n, thin, store, seed)
+    """
+    @numba.njit
+    def run(pos, data, args, out, n, thin, store, seed):
+        # seed in the thread we run in, numba's random state is not shared between threads
+        if seed >= 0:
+            np.random.seed(seed)
+        for s in range(n):
+            for _ in range(thin):
+                for i in range(dim):
+                    pos[i] = fct(pos, i, data, *args)
+            if store:
+                out[s, :] = pos
+    return run
+
+
+class CompiledEngine(object):
+    """
+    This is the object that holds the compiled sampling loop for a wrapped conditional function
+    """
+    def __init__(self, conditional_fct, dim):
+        """
+        The initialization of the compiled engine. The conditional function is compiled lazily on the first call to run
+
+        :param conditional_fct: the utils._FnWrap wrapped conditional function held by the model
+
+        :param dim: the dimension of the problem
+        """
+        if not available(conditional_fct):
+            raise ValueError("The numba engine needs numba installed and a single conditional function without kwargs")
+
+        fct = conditional_fct.compiled
+        if fct is None:
+            fct = numba.njit(conditional_fct.function)
+        self.data = conditional_fct.data
+        self.args = tuple(conditional_fct.args)
+        self.dim = dim
+        self._run = _make_run(fct, dim)
+        self._empty = np.empty((0, dim))
+
+    def run(self, pos, n, thin=1, out=None, random=None):
+        """
+        This function runs n steps of the compiled sampler
+
+        :param pos: the numpy array position we start from, it is updated in place
+
+        :param n: the number of steps to run
+
+        :param thin: (optional) the number of sweeps done for each step. defaults to 1
+
+        :param out: (optional) an (n, D) array (usually a slice of the backend chain) the samples are written into.
+        defaults to None which does not store the samples
+
+        :param random: (optional) the np.random.RandomState instance of the sampler, the numba random state is seeded
+        from it so runs are reproducible. defaults to None which does not seed it
+
+        :return: returns the updated position array
+        """
+        store = out is not None
+        seed = -1 if random is None else random.randint(2**31)
+        self._run(pos, self.data, self.args, out if store else self._empty, n, thin, store, seed)
+        return pos
+
+
+def available(conditional_fct):
+    """
+    This function checks if the compiled engine can be used for a wrapped conditional function
+
+    :param conditional_fct: the wrapped conditional function (or list of them) held by the model
+
+    :return: True if numba is installed and we have a single conditional function without wrapped kwargs
+    """
+    if numba is None or isinstance(conditional_fct, list):
+        return False
+    return not conditional_fct.kwargs
@@ -0,0 +1,490 @@
+# Copyright (C) 2018  Bruce Edelman
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import numpy as np
+from scipy import stats
+
+"""
+This File sets up the convergence diagnostics for one or more chains: the rank normalized split R-hat, the bulk and tail
+effective sample size and the Monte Carlo standard errors of Vehtari et al. (2021). Every function takes the chains as
+a numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of any of those. The chains are
+read a block of parameters at a time so we never hold more than (chains, draws, block) values at once, and everything
+is vectorized over the chains and the parameters of a block. These still read (and rank) every draw on each call, and
+reading a backend with bounded storage copies its chain, so for long runs that are checked often batch_summary gives
+cheaper batch means estimates from the block summaries the backend keeps as it is written
+"""
+
+
+def _sources(chains, discard=0, thin=1):
+    """
+    This function turns whatever we are passed into a list of 2-d (draws, D) arrays, one per chain
+
+    :param chains: numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of them
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains read from a backend
+
+    :param thin: (optional) factor by which to thin the chains read from a backend
+
+    :return: returns a list of 2-d arrays (views of the backend chains where possible) all with the same length
+    """
+    if not isinstance(chains, (list, tuple)):
+        chains = [chains]
+
+    out = []
+    for chain in chains:
+        if hasattr(chain, 'get_chain'):
+            out.append(chain.get_chain(discard=discard, thin=thin))
+        else:
+            chain = np.asarray(chain)
+            if chain.ndim == 3:
+                out.extend(chain[:, discard+thin-1::thin])
+            elif chain.ndim == 2:
+                out.append(chain[discard+thin-1::thin])
+            else:
+                raise ValueError("Chains must be of shape (draws, D) or (chains, draws, D):")
+
+    ndim = set(chain.shape[1] for chain in out)
+    if len(ndim) != 1:
+        raise ValueError("All chains must have the same dimension:")
+
+    # use the same number of draws from every chain
+    n = min(len(chain) for chain in out)
+    if n < 4:
+        raise ValueError("Need at least 4 draws in each chain to compute diagnostics:")
+    return [chain[:n] for chain in out]
+
+
+def _blocks(chains, discard=0, thin=1, block=64):
+    """
+    This is a generator that reads the chains a block of parameters at a time
+
+    :param chains: anything accepted by _sources()
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains read from a backend
+
+    :param thin: (optional) factor by which to thin the chains read from a backend
+
+    :param block: (optional) the number of parameters read at once
+
+    :return: yields numpy arrays of shape (chains, draws, block)
+    """
+    sources = _sources(chains, discard=discard, thin=thin)
+    D = sources[0].shape[1]
+    for lo in range(0, D, block):
+        yield np.stack([chain[:, lo:lo + block] for chain in sources]).astype(float)
+
+
+def _apply(fct, chains, discard=0, thin=1, block=64, **kwargs):
+    """
+    This function applies a diagnostic to each block of parameters and puts the results back together
+
+    :param fct: the diagnostic function that takes a (chains, draws, block) array and returns an array of length block
+
+    :param chains: anything accepted by _sources()
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains read from a backend
+
+    :param thin: (optional) factor by which to thin the chains read from a backend
+
+    :param block: (optional) the number of parameters read at once
+
+    :param kwargs: (optional) keyword arguments passed to fct
+
+    :return: returns a numpy array of length D
+    """
+    return np.concatenate([fct(x, **kwargs) for x in _blocks(chains, discard=discard, thin=thin, block=block)])
+
+
+def _split(x):
+    """
+    Splits each chain in half so R-hat and ESS also pick up trends within a chain (drops the middle draw if odd)
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of shape (2 * chains, draws // 2, p)
+    """
+    half = x.shape[1] // 2
+    return np.concatenate((x[:, :half], x[:, -half:]), axis=0)
+
+
+def _rank_normalize(x):
+    """
+    Replaces the draws by the normal scores of their ranks over all the chains
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of the same shape
+    """
+    m, n, p = x.shape
+    ranks = stats.rankdata(x.reshape(m * n, p), axis=0)
+    return stats.norm.ppf((ranks - 0.375) / (m * n + 0.25)).reshape(m, n, p)
+
+
+def _fold(x):
+    """
+    Folds the draws around the median of each parameter so the rank normalized R-hat is sensitive to the tails
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of the same shape
+    """
+    return np.abs(x - np.median(x, axis=(0, 1)))
+
+
+def _rhat(x):
+    """
+    The classic R-hat (potential scale reduction) of Gelman & Rubin
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of length p
+    """
+    n = x.shape[1]
+    B = n * np.var(np.mean(x, axis=1), axis=0, ddof=1)
+    W = np.mean(np.var(x, axis=1, ddof=1), axis=0)
+    var_hat = (n - 1.) / n * W + B / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(var_hat / W)
+
+
+def _autocovariance(x):
+    """
+    Computes the autocovariance of each chain and parameter with an FFT
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of the same shape, the autocovariance at lags 0 ... draws - 1
+    """
+    n = x.shape[1]
+    nfft = 1 << int(np.ceil(np.log2(2 * n)))
+    f = np.fft.rfft(x - np.mean(x, axis=1, keepdims=True), n=nfft, axis=1)
+    return np.fft.irfft(f * np.conjugate(f), n=nfft, axis=1)[:, :n] / n
+
+
+def _ess(x):
+    """
+    The effective sample size using Geyer's initial monotone sequence estimator, combining all the chains
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of length p
+    """
+    m, n, p = x.shape
+    acov = _autocovariance(x)
+    mean_var = np.mean(acov[:, 0], axis=0) * n / (n - 1.)
+    var_plus = mean_var * (n - 1.) / n
+    if m > 1:
+        var_plus = var_plus + np.var(np.mean(x, axis=1), axis=0, ddof=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = 1. - (mean_var - np.mean(acov, axis=0)) / var_plus
+    rho[0] = 1.
+
+    # sum the autocorrelations in pairs up to the first pair that is not positive (J) keeping the pairs monotone, and
+    # add the even autocorrelation of pair J when it is positive (or the pair is not negative) as ArviZ does
+    K = max((n - 3) // 2, 0)
+    pairs = rho[0:2 * K + 1:2] + rho[1:2 * K + 2:2]
+    nonpositive = pairs <= 0
+    J = np.where(np.any(nonpositive, axis=0), np.argmax(nonpositive, axis=0), K)
+    cols = np.arange(p)
+    rho_J = rho[2 * J, cols]
+    extra = np.where((rho_J > 0) | (pairs[J, cols] >= 0), rho_J, 0.)
+    before = np.arange(K + 1)[:, None] < J
+    tau = -1. + 2. * np.sum(np.where(before, np.minimum.accumulate(pairs, axis=0), 0.), axis=0) + extra
+    # anti-correlated chains can give a tiny or negative tau, bound it as in Vehtari et al. (2021)
+    tau = np.maximum(tau, 1. / np.log10(m * n))
+
+    # a constant chain has no variance so we give it ess = 1 like a single independent draw
+    return np.where(var_plus > 0, m * n / tau, 1.)
+
+
+def _ess_quantile(x, prob):
+    """
+    The effective sample size of the estimate of the prob quantile
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :param prob: the quantile, between 0 and 1
+
+    :return: numpy array of length p
+    """
+    q = np.quantile(x, prob, axis=(0, 1))
+    return _ess(_split((x <= q).astype(float)))
+
+
+def _rhat_rank(x):
+    """
+    The rank normalized split R-hat, the max of the bulk and folded (tail) R-hat
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of length p
+    """
+    x = _split(x)
+    return np.maximum(_rhat(_rank_normalize(x)), _rhat(_rank_normalize(_fold(x))))
+
+
+def _ess_bulk(x):
+    """
+    The bulk effective sample size, the ess of the rank normalized split chains
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of length p
+    """
+    return _ess(_rank_normalize(_split(x)))
+
+
+def _ess_tail(x):
+    """
+    The tail effective sample size, the min of the ess of the 5% and 95% quantiles
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of length p
+    """
+    return np.minimum(_ess_quantile(x, 0.05), _ess_quantile(x, 0.95))
+
+
+def _mcse_mean(x):
+    """
+    The Monte Carlo standard error of the mean
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :return: numpy array of length p
+    """
+    return np.std(x, axis=(0, 1), ddof=1) / np.sqrt(_ess(_split(x)))
+
+
+def _mcse_quantile(x, prob):
+    """
+    The Monte Carlo standard error of the prob quantile from the +-1 sigma interval of the quantile's rank
+
+    :param x: numpy array of shape (chains, draws, p)
+
+    :param prob: the quantile, between 0 and 1
+
+    :return: numpy array of length p
+    """
+    m, n, p = x.shape
+    S = m * n
+    ess = _ess_quantile(x, prob)
+    a = stats.beta.ppf([[0.1586553], [0.8413447]], ess * prob + 1, ess * (1 - prob) + 1)
+    # the lower draw is rounded down and the upper one up (as ArviZ does)
+    idx = np.clip(np.stack((np.floor(a[0] * S - 1), np.ceil(a[1] * S - 1))).astype(int), 0, S - 1)
+    xs = np.sort(x.reshape(S, p), axis=0)
+    cols = np.arange(p)
+    return (xs[idx[1], cols] - xs[idx[0], cols]) / 2.
+
+
+def rhat(chains, discard=0, thin=1, block=64):
+    """
+    This function computes the rank normalized split R-hat of each parameter. Values above ~1.01 mean the chains have
+    not converged (it is still useful for a single chain as the two halves are compared)
+
+    :param chains: numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of them
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains, defaults to 0
+
+    :param thin: (optional) factor by which to thin the chains, defaults to 1
+
+    :param block: (optional) the number of parameters read and computed at once, defaults to 64
+
+    :return: returns a numpy array of length D
+    """
+    return _apply(_rhat_rank, chains, discard=discard, thin=thin, block=block)
+
+
+def ess_bulk(chains, discard=0, thin=1, block=64):
+    """
+    This function computes the bulk effective sample size of each parameter (how well the center of the distribution
+    is sampled)
+
+    :param chains: numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of them
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains, defaults to 0
+
+    :param thin: (optional) factor by which to thin the chains, defaults to 1
+
+    :param block: (optional) the number of parameters read and computed at once, defaults to 64
+
+    :return: returns a numpy array of length D
+    """
+    return _apply(_ess_bulk, chains, discard=discard, thin=thin, block=block)
+
+
+def ess_tail(chains, discard=0, thin=1, block=64):
+    """
+    This function computes the tail effective sample size of each parameter (how well the 5% and 95% quantiles are
+    sampled)
+
+    :param chains: numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of them
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains, defaults to 0
+
+    :param thin: (optional) factor by which to thin the chains, defaults to 1
+
+    :param block: (optional) the number of parameters read and computed at once, defaults to 64
+
+    :return: returns a numpy array of length D
+    """
+    return _apply(_ess_tail, chains, discard=discard, thin=thin, block=block)
+
+
+def mcse_mean(chains, discard=0, thin=1, block=64):
+    """
+    This function computes the Monte Carlo standard error of the mean of each parameter
+
+    :param chains: numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of them
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains, defaults to 0
+
+    :param thin: (optional) factor by which to thin the chains, defaults to 1
+
+    :param block: (optional) the number of parameters read and computed at once, defaults to 64
+
+    :return: returns a numpy array of length D
+    """
+    return _apply(_mcse_mean, chains, discard=discard, thin=thin, block=block)
+
+
+def mcse_quantile(chains, prob, discard=0, thin=1, block=64):
+    """
+    This function computes the Monte Carlo standard error of a quantile of each parameter
+
+    :param chains: numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of them
+
+    :param prob: the quantile we want the error of, between 0 and 1
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains, defaults to 0
+
+    :param thin: (optional) factor by which to thin the chains, defaults to 1
+
+    :param block: (optional) the number of parameters read and computed at once, defaults to 64
+
+    :return: returns a numpy array of length D
+    """
+    if not 0 < prob < 1:
+        raise ValueError("Prob must be between 0 and 1:")
+    return _apply(_mcse_quantile, chains, discard=discard, thin=thin, block=block, prob=prob)
+
+
+def autocorr_time(chains, discard=0, thin=1, block=64):
+    """
+    This function computes the integrated autocorrelation time of each parameter (the number of steps per
+    independent sample) from the ess of the chains
+
+    :param chains: numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of them
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains, defaults to 0
+
+    :param thin: (optional) factor by which to thin the chains, defaults to 1
+
+    :param block: (optional) the number of parameters read and computed at once, defaults to 64
+
+    :return: returns a numpy array of length D
+    """
+    return _apply(lambda x: x.shape[0] * x.shape[1] / _ess(x), chains, discard=discard, thin=thin, block=block)
+
+
+def summary(chains, discard=0, thin=1, block=64):
+    """
+    This function computes all the diagnostics at once, reading each block of parameters a single time
+
+    :param chains: numpy array of shape (draws, D) or (chains, draws, D), a Backend or Sampler, or a list of them
+
+    :param discard: (optional) number of samples to ignore at the beginning of the chains, defaults to 0
+
+    :param thin: (optional) factor by which to thin the chains, defaults to 1
+
+    :param block: (optional) the number of parameters read and computed at once, defaults to 64
+
+    :return: returns a dictionary with keys 'mean', 'sd', 'rhat', 'ess_bulk', 'ess_tail', 'mcse_mean' and values
+    numpy arrays of length D
+    """
+    fcts = {'mean': lambda x: np.mean(x, axis=(0, 1)),
+            'sd': lambda x: np.std(x, axis=(0, 1), ddof=1),
+            'rhat': _rhat_rank,
+            'ess_bulk': _ess_bulk,
+            'ess_tail': _ess_tail,
+            'mcse_mean': _mcse_mean}
+
+    out = dict((key, []) for key in fcts)
+    for x in _blocks(chains, discard=discard, thin=thin, block=block):
+        for key, fct in fcts.items():
+            out[key].append(fct(x))
+    return dict((key, np.concatenate(value)) for key, value in out.items())
+
+
+def batch_summary(backends, params=None):
+    """
+    This function computes cheap estimates of the diagnostics from the block summaries of the backends (see
+    Backend.get_summary()) instead of the draws, so its cost only grows with the number of blocks. Each full block is
+    used as a batch: the ess and mcse of the mean come from the variance of the batch means and the split R-hat is the
+    classic (not rank normalized) R-hat of the first and second half of the blocks of each chain. The partial last block
+    is not used and with bounded storage only the blocks the backend still keeps are used
+
+    :param backends: a Backend or Sampler, or a list of them, all with the same summary_block
+
+    :param params: (optional) a parameter name (or column index) or list of them to only return those columns.
+    defaults to None which returns every column
+
+    :return: returns a dictionary with keys 'mean', 'sd', 'rhat', 'ess', 'mcse_mean' and values numpy arrays of length
+    D, and 'draws' the number of draws of each chain that were used
+    """
+    if not isinstance(backends, (list, tuple)):
+        backends = [backends]
+    backends = [getattr(b, 'backend', b) for b in backends]
+    if len(set(b.summary_block for b in backends)) != 1:
+        raise ValueError("All backends must have the same summary_block:")
+    size = backends[0].summary_block
+
+    summaries = [b.get_summary(params=params) for b in backends]
+    nblocks = min(np.sum(summary['count'] == size) for summary in summaries)
+    if nblocks < 4:
+        raise ValueError("Need at least 4 full blocks in each backend to compute the batch diagnostics:")
+
+    # (chains, blocks, p) means and variances of the last nblocks full blocks of each chain
+    full = [summary['count'] == size for summary in summaries]
+    means = np.stack([summary['mean'][f][-nblocks:] for summary, f in zip(summaries, full)])
+    variances = np.stack([summary['var'][f][-nblocks:] for summary, f in zip(summaries, full)])
+    m = len(backends)
+
+    mean = np.mean(means, axis=(0, 1))
+    var = np.mean(variances, axis=(0, 1)) + np.var(means, axis=(0, 1))
+    # the variance of the batch means within each chain is var * tau / size
+    var_batch = np.mean(np.var(means, axis=1, ddof=1), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ess = np.where(var_batch > 0, m * nblocks * var / var_batch, m * nblocks)
+
+    # the mean and within variance of each half chain from the blocks it is made of
+    half = nblocks // 2
+    halves = [(means[:, :half], variances[:, :half]), (means[:, -half:], variances[:, -half:])]
+    half_mean = np.concatenate([np.mean(mu, axis=1) for mu, _ in halves])
+    half_var = np.concatenate([np.mean(v, axis=1) + np.var(mu, axis=1) for mu, v in halves])
+    n = half * size
+    B = n * np.var(half_mean, axis=0, ddof=1)
+    W = np.mean(half_var, axis=0) * n / (n - 1.)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rhat = np.sqrt(((n - 1.) / n * W + B / n) / W)
+
+    return {'mean': mean,
+            'sd': np.sqrt(var * m * nblocks * size / (m * nblocks * size - 1.)),
+            'rhat': rhat,
+            'ess': ess,
+            'mcse_mean': np.sqrt(var_batch / (m * nblocks)),
+            'draws': nblocks * size}
@@ -0,0 +1,415 @@
+# Copyright (C) 2018  Bruce Edelman
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json
+import warnings
+import numpy as np
+from . import backend
+from . import storage
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+"""
+This File sets up exporting the chains of one or more backends to columnar files (NPZ, Arrow IPC/Feather and Parquet)
+and importing them back into backends. Every format uses the same layout: a 'chain' column with the id of the chain
+each sample comes from, a 'step' column with the step it was sampled at and one float column per parameter named after
+it. The parameter names, chain ids, random states, storage policies and any run metadata are stored as JSON alongside
+the samples (in the schema metadata for Arrow/Parquet and in a '__metadata__' array for NPZ) so nothing needs to be
+unpickled and the imported backends can be resumed with the same storage policies
+"""
+
+METADATA_KEY = '__metadata__'
+
+
+def _as_backends(backends):
+    """
+    This function turns a Backend, Sampler or list of them into a list of backends with the same parameters
+
+    :param backends: a Backend or Sampler, or a list of them
+
+    :return: returns a list of Backend instances
+    """
+    if not isinstance(backends, (list, tuple)):
+        backends = [backends]
+    backends = [getattr(b, 'backend', b) for b in backends]
+    for b in backends:
+        if not b.initialized or b.iteration <= 0:
+            raise AttributeError("Must run sampler and store values to export the backend:")
+        if b.params != backends[0].params:
+            raise ValueError("All backends must have the same parameters to be exported together:")
+    return backends
+
+
+def _random_state(random):
+    """
+    This function turns a random state into something we can store as JSON
+
+    :param random: a np.random.RandomState instance, its get_state() tuple or None
+
+    :return: returns a list (or None)
+    """
+    if random is None:
+        return None
+    if isinstance(random, np.random.RandomState):
+        random = random.get_state()
+    return [v.tolist() if isinstance(v, np.ndarray) else v for v in random]
+
+
+def _as_random(random):
+    """
+    This function turns a random state stored by _random_state() back into a RandomState
+
+    :param random: the list stored in the metadata
+
+    :return: returns a np.random.RandomState instance
+    """
+    out = np.random.RandomState()
+    out.set_state((random[0], np.asarray(random[1], dtype=np.uint32)) + tuple(random[2:]))
+    return out
+
+
+def _policies(b):
+    """
+    This function describes the storage policies of a backend so they can be stored as JSON
+
+    :param b: a Backend instance
+
+    :return: returns a list with a dictionary for each policy in the order they are applied
+    """
+    policies = list(b.filters) + ([] if b.bounded is None else [b.bounded])
+    out = []
+    for policy in policies:
+        info = {'type': type(policy).__name__, 'seen': int(policy.seen)}
+        for name in ('k', 'size'):
+            if hasattr(policy, name):
+                info[name] = int(getattr(policy, name))
+        if isinstance(policy, storage.Reservoir):
+            info['random_state'] = _random_state(policy.random)
+        out.append(info)
+    return out
+
+
+def _as_policies(infos):
+    """
+    This function rebuilds the storage policies described by _policies(). Policies that are not one of the storage
+    module's are skipped with a warning
+
+    :param infos: the list of dictionaries stored in the metadata
+
+    :return: returns a list of StoragePolicy instances
+    """
+    out = []
+    for info in infos:
+        cls = getattr(storage, info['type'], None)
+        if not (isinstance(cls, type) and issubclass(cls, storage.StoragePolicy)) or cls is storage.StoragePolicy:
+            warnings.warn("gibbsPy: Can not rebuild the storage policy {}, it is not used by the imported "
+                          "backend".format(info['type']))
+            continue
+        if cls is storage.Reservoir:
+            policy = cls(info['size'], random=_as_random(info['random_state']))
+        else:
+            policy = cls(info['k'] if 'k' in info else info['size'])
+        policy.seen = info['seen']
+        out.append(policy)
+    return out
+
+
+def _columns(backends, chain_ids):
+    """
+    This function lays out the samples of the backends as columns
+
+    :param backends: list of Backend instances
+
+    :param chain_ids: list of the integer id of each backend
+
+    :return: returns a dictionary of column name to numpy array
+    """
+    columns = {'chain': np.concatenate([np.full(b.iteration, c, dtype=np.int32) for b, c in zip(backends, chain_ids)]),
+               'step': np.concatenate([b.get_attribute('steps') for b in backends])}
+    chains = [b.get_chain() for b in backends]
+    for j, name in enumerate(backends[0].params):
+        columns[name] = np.concatenate([chain[:, j] for chain in chains])
+    return columns
+
+
+def _metadata(backends, chain_ids, metadata):
+    """
+    This function builds the JSON metadata stored with the samples
+
+    :param backends: list of Backend instances
+
+    :param chain_ids: list of the integer id of each backend
+
+    :param metadata: dictionary of extra (JSON serializable) run metadata, or None
+
+    :return: returns the JSON string
+    """
+    from . import __version__
+    chains = {}
+    for b, c in zip(backends, chain_ids):
+        chains[str(c)] = {'nsteps': int(b.nsteps),
+                          'accepted': int(b.accepted),
+                          'last_pos': b.last_pos.tolist(),
+                          'random_state': _random_state(b.random_state),
+                          'storage': _policies(b),
+                          'summary_block': int(b.summary_block),
+                          'max_blocks': b.max_blocks,
+                          # the row of the chain each exported sample was in, bounded storage writes out of order
+                          'rows': None if b.bounded is None else
+                          np.argsort(b.steps[:b.iteration], kind='stable').tolist()}
+    return json.dumps({'params': list(backends[0].params),
+                       'chain_ids': [int(c) for c in chain_ids],
+                       'chains': chains,
+                       'metadata': {} if metadata is None else metadata,
+                       'gibbsPy_version': __version__})
+
+
+def _prepare(backends, chain_ids, metadata):
+    """
+    This function sets up the columns and metadata of the backends we export
+
+    :param backends: a Backend or Sampler, or a list of them
+
+    :param chain_ids: list of the integer id of each backend, or None for 0 ... len(backends) - 1
+
+    :param metadata: dictionary of extra (JSON serializable) run metadata, or None
+
+    :return: returns a tuple of the columns dictionary and the JSON metadata string
+    """
+    backends = _as_backends(backends)
+    if chain_ids is None:
+        chain_ids = list(range(len(backends)))
+    if len(chain_ids) != len(backends):
+        raise ValueError("Must give one chain id for each backend:")
+    return _columns(backends, chain_ids), _metadata(backends, chain_ids, metadata)
+
+
+def _backends(columns, meta, params=None):
+    """
+    This function rebuilds backends from columns read from a file
+
+    :param columns: fct that returns the numpy array of a column given its name
+
+    :param meta: the dictionary of the JSON metadata
+
+    :param params: list of the parameter names that were read, or None for all of them
+
+    :return: returns a dictionary of chain id to Backend instance, with the storage policies of the exported backend
+    """
+    params = meta['params'] if params is None else list(params)
+    cols = [meta['params'].index(p) for p in params]
+    chain = columns('chain')
+    step = columns('step')
+    values = np.stack([columns(p) for p in params], axis=1) if params else np.empty((len(chain), 0))
+
+    out = {}
+    for c in meta['chain_ids']:
+        sel = chain == c
+        info = meta['chains'][str(c)]
+        policies = _as_policies(info.get('storage', []))
+        seen = [policy.seen for policy in policies]
+        b = backend.Backend(storage=policies or None, summary_block=info.get('summary_block', 10000),
+                            max_blocks=info.get('max_blocks'))
+        b.reset(len(params), params=params)
+        # reset() restarts the policy counters, put back the ones of the exported backend
+        for policy, k in zip(policies, seen):
+            policy.seen = k
+        rows = np.ascontiguousarray(values[sel], dtype=float)
+        steps = np.asarray(step[sel], dtype=np.int64)
+        b.iteration = len(rows)
+        b.nsteps = info['nsteps']
+        if b.bounded is None:
+            # every accepted sample is in the chain so we can rebuild the block summaries
+            b.chain, b.steps = rows, steps
+            b.accepted = b.block_fill = b.iteration
+            b._close_blocks()
+        else:
+            b.accepted = info['accepted']
+            # the rows were exported in the order they were sampled, put them back in the rows the bounded policy
+            # wrote them to so it keeps replacing the same samples
+            idx = np.arange(b.iteration) if info.get('rows') is None else np.asarray(info['rows'], dtype=int)
+            b.chain = np.empty_like(rows)
+            b.steps = np.empty_like(steps)
+            b.chain[idx], b.steps[idx] = rows, steps
+            # the samples the bounded storage did not keep can not be summarized again
+            b.block_offset = b.accepted
+        b.last_pos = np.asarray(info['last_pos'], dtype=float)[cols]
+        if info['random_state'] is not None:
+            b.random_state = _as_random(info['random_state'])
+        out[c] = b
+    return out
+
+
+def _check_pyarrow():
+    """
+    This function raises an ImportError if pyarrow is not installed
+
+    :return: This function does not return anything
+    """
+    if pa is None:
+        raise ImportError("gibbsPy: pyarrow is needed to export to or import from Arrow and Parquet")
+
+
+def _table(columns, meta):
+    """
+    This function builds the pyarrow Table of the columns with the metadata in its schema
+
+    :param columns: dictionary of column name to numpy array
+
+    :param meta: the JSON metadata string
+
+    :return: returns a pyarrow.Table
+    """
+    table = pa.table(columns)
+    return table.replace_schema_metadata({METADATA_KEY: meta})
+
+
+def to_npz(file, backends, chain_ids=None, metadata=None, compressed=False):
+    """
+    This function exports the chains to a numpy .npz file with one array per column
+
+    :param file: the file name or open file to write to
+
+    :param backends: a Backend or Sampler, or a list of them
+
+    :param chain_ids: (optional) list of the integer id of each backend, defaults to 0 ... len(backends) - 1
+
+    :param metadata: (optional) dictionary of extra (JSON serializable) run metadata to store
+
+    :param compressed: (optional) Bool, whether to compress the file, defaults to False
+
+    :return: This function does not return anything
+    """
+    columns, meta = _prepare(backends, chain_ids, metadata)
+    columns[METADATA_KEY] = np.array(meta)
+    (np.savez_compressed if compressed else np.savez)(file, **columns)
+
+
+def from_npz(file, params=None):
+    """
+    This function imports the chains of a .npz file written by to_npz. Only the columns we ask for are read
+
+    :param file: the file name or open file to read from
+
+    :param params: (optional) list of the parameter names to read, defaults to None which reads all of them
+
+    :return: returns a dictionary of chain id to Backend instance
+    """
+    with np.load(file, allow_pickle=False) as f:
+        meta = json.loads(str(f[METADATA_KEY]))
+        return _backends(lambda name: f[name], meta, params=params)
+
+
+def to_arrow(file, backends, chain_ids=None, metadata=None, compression=None):
+    """
+    This function exports the chains to an Arrow IPC (Feather v2) file
+
+    :param file: the file name to write to
+
+    :param backends: a Backend or Sampler, or a list of them
+
+    :param chain_ids: (optional) list of the integer id of each backend, defaults to 0 ... len(backends) - 1
+
+    :param metadata: (optional) dictionary of extra (JSON serializable) run metadata to store
+
+    :param compression: (optional) 'lz4' or 'zstd' to compress the file, defaults to None which keeps it uncompressed
+    so it can be memory mapped without copying
+
+    :return: This function does not return anything
+    """
+    _check_pyarrow()
+    table = _table(*_prepare(backends, chain_ids, metadata))
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(file, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+
+def read_arrow(file, params=None):
+    """
+    This function memory maps an Arrow IPC file written by to_arrow, so (uncompressed) columns are read without copying
+
+    :param file: the file name to read from
+
+    :param params: (optional) list of the parameter names to read, defaults to None which reads all of them. The
+    'chain' and 'step' columns are always read
+
+    :return: returns a tuple of the pyarrow.Table and the dictionary of the metadata
+    """
+    _check_pyarrow()
+    table = pa.ipc.open_file(pa.memory_map(file, 'r')).read_all()
+    meta = json.loads(table.schema.metadata[METADATA_KEY.encode()])
+    if params is not None:
+        table = table.select(['chain', 'step'] + list(params))
+    return table, meta
+
+
+def from_arrow(file, params=None):
+    """
+    This function imports the chains of an Arrow IPC file written by to_arrow
+
+    :param file: the file name to read from
+
+    :param params: (optional) list of the parameter names to read, defaults to None which reads all of them
+
+    :return: returns a dictionary of chain id to Backend instance
+    """
+    table, meta = read_arrow(file, params=params)
+    return _backends(lambda name: table.column(name).to_numpy(), meta, params=params)
+
+
+def to_parquet(file, backends, chain_ids=None, metadata=None, row_group_size=100000, compression='snappy'):
+    """
+    This function exports the chains to a Parquet file
+
+    :param file: the file name to write to
+
+    :param backends: a Backend or Sampler, or a list of them
+
+    :param chain_ids: (optional) list of the integer id of each backend, defaults to 0 ... len(backends) - 1
+
+    :param metadata: (optional) dictionary of extra (JSON serializable) run metadata to store
+
+    :param row_group_size: (optional) the number of samples in each row group, defaults to 100000
+
+    :param compression: (optional) the parquet compression codec, defaults to 'snappy'
+
+    :return: This function does not return anything
+    """
+    _check_pyarrow()
+    table = _table(*_prepare(backends, chain_ids, metadata))
+    pa.parquet.write_table(table, file, row_group_size=row_group_size, compression=compression)
+
+
+def from_parquet(file, params=None):
+    """
+    This function imports the chains of a Parquet file written by to_parquet. Only the columns we ask for are read
+
+    :param file: the file name to read from
+
+    :param params: (optional) list of the parameter names to read, defaults to None which reads all of them
+
+    :return: returns a dictionary of chain id to Backend instance
+    """
+    _check_pyarrow()
+    columns = None if params is None else ['chain', 'step'] + list(params)
+    table = pa.parquet.read_table(file, columns=columns)
+    meta = json.loads(pa.parquet.read_schema(file).metadata[METADATA_KEY.encode()])
+    return _backends(lambda name: table.column(name).to_numpy(), meta, params=params)
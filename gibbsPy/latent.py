@@ -0,0 +1,165 @@
+# Copyright (C) 2018  Bruce Edelman
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import numpy as np
+from . import sampler
+from . import state
+from .pbar import *
+
+"""
+This File sets up the LatentSampler for models with a discrete latent label for every data point (mixture or cluster
+assignments) and a few continuous global parameters. The labels are held as an int32 array next to the float globals
+and are all drawn at once: the user gives the (N, K) matrix of log probabilities of each label given the globals and we
+draw from it with the Gumbel-max trick. Each sweep draws every label and then does a normal gibbs sweep of the globals
+given the labels. Only the globals are stored in the backend
+"""
+
+
+def gumbel_max(logp, random, out=None):
+    """
+    This function draws one category from each row of a matrix of (unnormalized) log probabilities with the Gumbel-max
+    trick, argmax_k(logp_k + g_k) with g_k standard Gumbel noise
+
+    :param logp: numpy array of shape (N, K) of log probabilities, the rows do not need to be normalized
+
+    :param random: the np.random.RandomState instance to draw the noise with
+
+    :param out: (optional) int32 numpy array of length N the draws are written into
+
+    :return: returns an int32 numpy array of length N of the drawn categories
+    """
+    logp = np.asarray(logp)
+    if out is None:
+        out = np.empty(logp.shape[0], dtype=np.int32)
+    out[:] = np.argmax(logp + random.gumbel(size=logp.shape), axis=1)
+    return out
+
+
+class LatentState(state.State):
+    """
+    This is the State of a LatentSampler, the float global parameters (pos) and the int32 label of each data point
+    """
+    def __init__(self, pos, labels=None, random=None):
+        """
+        This is the Initalization of our LatentState class
+
+        :param pos: numpy array of the global parameters
+
+        :param labels: (optional) int32 numpy array of the label of each data point. defaults to None before the labels
+        are first drawn
+
+        :param random: (optional) np.random.RandomState() instance
+        """
+        super(LatentState, self).__init__(pos, random=random)
+        self.labels = None if labels is None else np.asarray(labels, dtype=np.int32)
+
+    def __repr__(self):
+        return "LatentState(pos={0}, labels={1}, random_state={2})".format(self.pos, self.labels, self.random_state)
+
+    def __iter__(self):
+        return iter((self.pos, self.labels, self.random_state))
+
+
+class LatentSampler(sampler.Sampler):
+    """
+    This is the Sampler object that alternates vectorized draws of the labels with gibbs sweeps of the global parameters
+    """
+    def __init__(self, D, label_logp, sampling_params=None, chunk=None, **kwargs):
+        """
+        The intialization function called when we set up an instance of our latent sampler object
+
+        :param D: The number of global parameters
+
+        :param label_logp: function called as label_logp(pos, data) that returns the (N, K) numpy array of the log
+        probability (up to a constant for each row) of each label of each data point given the globals pos
+
+        :param sampling_params: (Optional) This is a list of strings with the name of each global parameter
+
+        :param chunk: (optional) if given, label_logp is called on chunks of this many data points (the first axis of
+        data) at a time so we never hold the whole (N, K) matrix. defaults to None which calls it on all of the data
+
+        :param kwargs: These are all passed to the Sampler initialization (initial_state, data, cond_fct, etc.). The
+        conditional functions of the globals are called with the current labels as a labels keyword argument
+        """
+        super(LatentSampler, self).__init__(D, sampling_params=sampling_params, **kwargs)
+        self.label_logp = label_logp
+        self.chunk = None if chunk is None else int(chunk)
+        self.labels = None
+
+        self._previous_state = LatentState(self._previous_state.pos, random=self._previous_state.random_state)
+
+    def _draw_labels(self, pos):
+        """
+        This function draws the label of every data point given the globals, updating self.labels in place
+
+        :param pos: numpy array of the global parameters
+
+        :return: returns the int32 numpy array of the labels
+        """
+        if self.chunk is None:
+            logp = self.label_logp(pos, self.data)
+            if self.labels is None:
+                self.labels = np.empty(len(logp), dtype=np.int32)
+            return gumbel_max(logp, self._random, out=self.labels)
+
+        N = len(self.data)
+        if self.labels is None:
+            self.labels = np.empty(N, dtype=np.int32)
+        for lo in range(0, N, self.chunk):
+            hi = min(lo + self.chunk, N)
+            gumbel_max(self.label_logp(pos, self.data[lo:hi]), self._random, out=self.labels[lo:hi])
+        return self.labels
+
+    def sample(self, initial, n, store=False, thin=1, progress=False):
+        """
+        This is the Generator for sampling the labels and the globals
+
+        :param initial: THis is the initial state we are in, an instance of State or LatentState object. Its labels
+        (if any) are not needed as every sweep starts by drawing the labels
+
+        :param n: Number of steps to evovle our chain
+
+        :param store: (optional) bool value that sets whether we store the globals in the backend or not defaults to
+        False
+
+        :param thin: (optional) This value is how many sweeps we do for each step. defaults to no thinning (thin = 1)
+
+        :param progress: (optional) Boolean value that decides whether or not to show a progress bar during sampling.
+        defaults to False
+
+        :return: This is a generator so it yields the LatentState at each step
+        """
+        newState = initial
+        if not isinstance(newState, LatentState):
+            newState = LatentState(initial.pos, random=initial.random_state)
+
+        if store:
+            self.backend.grow(n)
+        thin = int(thin)
+        if thin <= 0:
+            raise ValueError("Thin must be strictly positive:")
+
+        sampler._seed_global(self.conditional_fct, self._random)
+        with progress_bar(progress, n * thin) as prog_bar:
+            for _ in range(n):
+                for _ in range(thin):
+                    newState.labels = self._draw_labels(newState.pos)
+                    sampler._sweep(self.conditional_fct, self.dim, newState.pos, labels=newState.labels)
+                    prog_bar.update(1)
+
+                if store:
+                    self.backend.save_sample(newState)
+                yield newState
@@ -16,7 +16,6 @@
 
 
 from . import utils
-import types
 
 """
 This file sets up the Model to be used in our GibbsSampling This is the object that holds most of the details specfic
@@ -50,17 +49,16 @@ class Model(object):
 
         self.dim = D
 
-        # check to make sure cond_fct is a type Function and has the correct shape if not:
-        if not isinstance(cond_fct, types.FunctionType):
+        # check to make sure cond_fct is a callable (function, method or numba compiled function) and has the correct
+        # shape if not:
+        if not callable(cond_fct):
             if len(cond_fct) != self.dim:
                 raise ValueError("Cond_fct must be a single fct for each parameter or a list of D fcts where "
                              "D is the dimension of the model:")
 
         # Handle the defaulting for the params
         if params is None:
-            self.params = []*self.dim
-            for i in range(self.dim):
-                self.params[i] = 'x%s' % i
+            self.params = ['x%s' % i for i in range(self.dim)]
         elif len(params) != self.dim:
             raise ValueError('List of parameter names must be the same length as the dimension of the probelem or None:')
         else:
@@ -73,7 +71,7 @@ class Model(object):
             self.data = None
 
         # If we pass a single function to cond_fct, wrap it up with _FnWrapper
-        if isinstance(cond_fct, types.FunctionType):
+        if callable(cond_fct):
             self.wrapped_fct = utils._FnWrap(cond_fct, static_params, data=self.data, random=random, **kwargs)
         # Else we use (WIP) mulit wrap fct to wrap each cond_fct with _FnWrapper
         else:
@@ -102,8 +100,8 @@ class Model(object):
 
         # Make sure each element of the list is a function type
         for i in fcts:
-            if not isinstance(i, types.FunctionType):
-                raise ValueError("Each element in cond_fct must be of type: Function")
+            if not callable(i):
+                raise ValueError("Each element in cond_fct must be callable")
 
         # intialize list
         wrapped_fcts = []
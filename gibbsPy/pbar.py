@@ -66,4 +66,4 @@ def progress_bar(progress, total):
                 return getattr(tqdm, 'tqdm_' + progress)(total=total)
 
     else:
-        return _NoProgress
\ No newline at end of file
+        return _NoProgress()
\ No newline at end of file
@@ -14,8 +14,13 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import asyncio
+import functools
+import threading
+import warnings
 import numpy as np
 from . import backend
+from . import compiled
 from . import model
 from . import state
 from .pbar import *
@@ -30,7 +35,7 @@ class Sampler(object):
     This is the Sampler object that does the gibbs sampling
     """
     def __init__(self, D, sampling_params=None, static_params=None, initial_state=None, random=None, back=None,
-                 resume=False, data=None, **kwargs):
+                 resume=False, data=None, storage=None, **kwargs):
         """
         The intialization function called when we set up an instance of our sampler object
 
@@ -66,6 +71,10 @@ class Sampler(object):
         the second axis must have length = D so that we have at least one data point for each paramter. (#TODO currently
         requires N be the same for each paramter. fix this later?)
 
+        :param storage: (optional) a storage.StoragePolicy instance or list of them passed to the backend we create to
+        decide at write time which samples are kept (e.g. [storage.Discard(1000), storage.Thin(10)]). If back is passed
+        the storage policies must be set on that backend instead
+
         :param kwargs: (optional) These can be any keyword arguments that we may need to pass to our conditional function
         This depends on the user-generated conditional function that we want to sample from in our gibbs sampling
         """
@@ -75,9 +84,7 @@ class Sampler(object):
 
         # Store parameter names and make sure same length as dimension
         if sampling_params is None:
-            self.params = [] * self.dim
-            for i in range(self.dim):
-                self.params[i] = 'x%s' % i
+            self.params = ['x%s' % i for i in range(self.dim)]
         elif len(sampling_params) != self.dim:
             raise ValueError(
                 'List of parameter names must be the same length as the dimension of the probelem or None:')
@@ -88,28 +95,30 @@ class Sampler(object):
         # possible to keep us starting from that pos:
         ranstate = None
         self._previous_state = None
-        self.backend = backend.Backend() if back is None else back
+        if back is not None and storage is not None:
+            raise ValueError("Storage policies must be passed to the Backend directly when passing back:")
+        self.backend = backend.Backend(storage=storage) if back is None else back
         if data is not None:
             self.data = data
         else:
             self.data = None
         if not self.backend.initialized and not resume:
             self._previous_state = None
-            self.backend.reset(self.dim)
-            ranstate = np.random.get_state()
+            self.backend.reset(self.dim, params=self.params)
+            ranstate = np.random.get_state() if random is None else random
         elif self.backend.initialized and resume:
-            if self.backend.shape != self.model.dim:
+            if self.backend.dim != self.dim:
                 raise ValueError("The shape of backend does not match the model dimension")
 
             ranstate = self.backend.random_state
-            iteration = self.backend.iteration
+            iteration = self.backend.nsteps
             if iteration > 0:
                 self._previous_state = self.backend.get_last_sample()
             else:
                 raise ValueError("Must Run the chain before resuming:")
         elif self.backend.initialized and not resume:
             self._previous_state = self.backend.get_last_sample()
-            self.backend.reset(self.dim)
+            self.backend.reset(self.dim, params=self.params)
             ranstate = self.backend.random_state
 
         # Setup the Random number generator with new state random or the passed in state from the previous backend
@@ -118,6 +127,9 @@ class Sampler(object):
                 ranstate = np.random.get_state()
             else:
                 ranstate = random
+        # backends store the RandomState instance itself so get its state tuple
+        if isinstance(ranstate, np.random.RandomState):
+            ranstate = ranstate.get_state()
         self._random = np.random.RandomState()
         self._random.set_state(ranstate)
 
@@ -141,6 +153,8 @@ class Sampler(object):
         # retreive the wrapped conditional function from the model (uses our handy function wrapper so that we can
         # use kwargs or args when calling the fct without having to call them each time:
         self.conditional_fct = self.model.wrapped_fct
+        # the compiled engine is built the first time we sample with engine='numba'
+        self._engine = None
 
     def has_data(self):
         """
@@ -191,7 +205,117 @@ class Sampler(object):
         self._previous_state = results
         return results
 
-    def sample(self, initial, n, store=False, thin=1, progress=False):
+    async def arun(self, n, store=True, batch=100, executor=None, callback=None, **kwargs):
+        """
+        This is the asyncio version of run_gibs. The sampling is done in an executor in batches of steps so the event loop
+        is free to run other tasks between batches. Cancelling the task stops the run after the current step and leaves
+        the sampler (and backend) at that step so it can be continued with another call to run_gibs or arun
+
+        :param n: This is the number of steps to run the sampler for
+
+        :param store: (optional) This a bool value that determines if we save our samples in our backend object or not
+        defaults to True
+
+        :param batch: (optional) The number of steps done in the executor before control is handed back to the event
+        loop. defaults to 100
+
+        :param executor: (optional) a concurrent.futures.Executor to run the batches in. defaults to None which uses the
+        default executor of the event loop
+
+        :param callback: (optional) a function called after each batch as callback(steps_done, n) to stream progress
+
+        :param kwargs: (optional) these keyword args are passed into sample (currently include thin=1, progress=False)
+
+        :return: this returns the final state of the chain (must use the backend object to retreieve all of the samples
+        """
+
+        # Setup the initial state
+        if self._previous_state is not None:
+            initial_state = self._previous_state
+        else:
+            raise ValueError("The previous sate of the sampler must be set when "
+                             "intializing sampler or the backend must have been ran before with resume=True:")
+
+        results = None
+        done = 0
+        # run the async generator to generate the state after each batch
+        async for steps, results in self._abatches(initial_state, n, store=store, batch=batch, executor=executor,
+                                                   **kwargs):
+            done += steps
+            if callback is not None:
+                callback(done, n)
+        # store the last state as the previous state for the sample/backend
+        self._previous_state = results
+        return results
+
+    async def asample(self, initial, n, batch=100, executor=None, **kwargs):
+        """
+        This is the async Generator version of sample. It runs sample in an executor for one batch of steps at a time
+        (so the backend only grows by a batch at a time) and yields the state after each batch. The sampler should not
+        be used by anything else until this generator is done
+
+        :param initial: THis is the initial state we are in must be an instance of State object
+
+        :param n: Number of steps to evovle our chain
+
+        :param batch: (optional) The number of steps done in the executor for each state we yield. defaults to 100
+
+        :param executor: (optional) a concurrent.futures.Executor to run the batches in. defaults to None which uses the
+        default executor of the event loop
+
+        :param kwargs: (optional) these keyword args are passed into sample (store, thin, engine, chunk). progress is
+        handled here with a single progress bar for all of the batches
+
+        :return: This is an async generator so it yields the State object after each batch of steps
+        """
+        async for _, results in self._abatches(initial, n, batch=batch, executor=executor, **kwargs):
+            yield results
+
+    async def _abatches(self, initial, n, batch=100, executor=None, **kwargs):
+        """
+        This is the async Generator behind asample and arun, it yields the number of steps done in each batch with the
+        state after it. The parameters are the same as asample
+
+        :return: This is an async generator so it yields a tuple of the number of steps done and the State object after
+        each batch of steps
+        """
+        batch = int(batch)
+        if batch <= 0:
+            raise ValueError("Batch must be strictly positive:")
+        progress = kwargs.pop('progress', False)
+        thin = kwargs.get('thin', 1)
+
+        loop = asyncio.get_running_loop()
+        stop = threading.Event()
+        compiled_engine = None
+        if kwargs.get('engine', 'python') == 'numba':
+            # one compiled chunk per batch, so every yield of a batch is the whole batch and we can still stop (and hand
+            # back to the event loop) between batches
+            kwargs['chunk'] = min(int(kwargs.get('chunk', 1000)), batch)
+            compiled_engine = await loop.run_in_executor(executor, self._compiled_engine, initial.pos,
+                                                         kwargs.get('store', False))
+        done = 0
+        with progress_bar(progress, n * thin) as prog_bar:
+            while done < n:
+                k = min(batch, n - done)
+                # the generator is made in the executor too as some samplers do work up front (e.g. CollapsedSampler)
+                make = functools.partial(self.sample, initial, k, progress=False, **kwargs)
+                fut = loop.run_in_executor(executor, _advance, make, k, stop, 1 if compiled_engine is None else k)
+                try:
+                    # shield the batch so cancelling us does not abandon the thread in the middle of a step
+                    steps, results = await asyncio.shield(fut)
+                except asyncio.CancelledError:
+                    stop.set()
+                    await fut
+                    raise
+                if steps == 0:
+                    break
+                done += steps
+                initial = results
+                prog_bar.update(steps * thin)
+                yield steps, results
+
+    def sample(self, initial, n, store=False, thin=1, progress=False, engine='python', chunk=1000):
         """
         This is the Generator for sampling the next values from the conditional distribution we are trying to sample
         from
@@ -203,14 +327,23 @@ class Sampler(object):
         :param store: (optional) bool value that sets whether we store the values in the backend or not defaults to False
 
         :param thin: (optional) This value is how many samples we want to thin the chain by. defaults to no thinning
-        (thin = 1)
+        (thin = 1). This thins every state we yield, to only thin what is stored use a storage.Thin policy instead
 
         :param progress: (optional) Boolean value set from the kwargs passed into run_gibbs or burnin_gibbs that decides
         whether or not to show a progress bar during sampling. defaults to False
 
+        :param engine: (optional) either 'python' or 'numba'. The numba engine compiles the whole sampling loop with the
+        conditional function (see compiled.py) and falls back to the python engine with a warning if it can not.
+        defaults to 'python'
+
+        :param chunk: (optional) The number of steps the numba engine runs between each state it yields. defaults to
+        1000
+
         :return: This is a generator so it yields the next sample at each iteration: (samples are object instances of
-        the State object)
+        the State object). The numba engine yields the state after each chunk of steps instead
         """
+        if engine not in ('python', 'numba'):
+            raise ValueError("Engine must be either 'python' or 'numba':")
         # Initialize the newState as the old
         newState = initial
 
@@ -229,21 +362,33 @@ class Sampler(object):
             intermediate_step = 1
         # set the total iterations for pbar
         total = n * intermediate_step
+        # get the compiled engine if we can use it
+        compiled_engine = self._compiled_engine(newState.pos, store) if engine == 'numba' else None
+
         # set up our progress bar
         with progress_bar(progress, total) as prog_bar:
+            if compiled_engine is not None:
+                done = 0
+                while done < n:
+                    k = min(int(chunk), n - done)
+                    # write straight into the rows of the backend chain we are about to fill
+                    out = self.backend.chain[self.backend.iteration:self.backend.iteration + k] if store else None
+                    compiled_engine.run(newState.pos, k, intermediate_step, out, random=self._random)
+                    if store:
+                        self.backend.save_written(k, newState)
+                    done += k
+                    prog_bar.update(k * intermediate_step)
+                    yield newState
+                return
+
+            # numba compilable conditionals draw from np.random, seed it so the python engine is reproducible too
+            _seed_global(self.conditional_fct, self._random)
             # Loop through our desired range
             for _ in range(n):
                 # loop through the thinning procedure
                 for _ in range(thin):
-                    # Loop through each parameter dimension since Gibbs Sampling algorithm has us directly sample each
-                    # parameter from the conditional probability functions:
-                    for i in range(self.dim):
-                        # find the new value for paramter i feom the conditinoal distribution
-                        try:
-                            idx = self.conditional_fct[i].idx
-                            newState.pos[idx] = self.conditional_fct[i](initial.pos, i)
-                        except TypeError:
-                            newState.pos[i] = self.conditional_fct(initial.pos, i)
+                    # do one gibbs sweep through each parameter
+                    _sweep(self.conditional_fct, self.dim, newState.pos)
 
                     prog_bar.update(1)
                 # If we store we want to save each sample in the backend (after thinning since n is final amount of
@@ -253,6 +398,50 @@ class Sampler(object):
                 # generate the state
                 yield newState
 
+    def _compiled_engine(self, pos, store):
+        """
+        This function builds (once) and returns the compiled engine, or None if we have to use the python engine
+
+        :param pos: the current position, used to compile the engine with a single step on a copy of it
+
+        :param store: Bool whether we store the samples, as the compiled engine can only store without storage policies
+
+        :return: returns a compiled.CompiledEngine instance or None
+        """
+        if store and not self.backend.direct():
+            warnings.warn("gibbsPy: The numba engine can not store into a backend with storage policies, "
+                          "using the python engine")
+            return None
+        if self._engine is None:
+            if not compiled.available(self.conditional_fct):
+                warnings.warn("gibbsPy: The numba engine needs numba and a single conditional function without kwargs, "
+                              "using the python engine")
+                self._engine = False
+            else:
+                try:
+                    self._engine = compiled.CompiledEngine(self.conditional_fct, self.dim)
+                    self._engine.run(np.array(pos, dtype=float), 1)
+                except Exception as e:
+                    # numba raises errors that are not NumbaErrors too (e.g. UnsupportedBytecodeError), any failure
+                    # to build or run the engine falls back to the python engine
+                    warnings.warn("gibbsPy: Could not compile the conditional function, using the python engine: "
+                                  "{}".format(e))
+                    self._engine = False
+        return self._engine if self._engine else None
+
+    def get_summary(self, **kwargs):
+        """
+        This is a function that connects the sampler with the backend so we can get the block summaries out:
+
+        :param kwargs: These kwargs are optional values passed to the backend get_summary fct (params)
+
+        :return: This returns the dictionary of the block summaries, see backend.get_summary()
+        """
+        if self.backend.initialized:
+            return self.backend.get_summary(**kwargs)
+        else:
+            raise ValueError("Must have backend initialized and chain ran before retrieving the summary")
+
     def get_chain(self, **kwargs):
         """
         This is a function that connects the sampler with the backend so we can get the chain out:
@@ -267,4 +456,77 @@ class Sampler(object):
         if self.backend.initialized:
             return self.backend.get_chain(**kwargs)
         else:
-            raise ValueError("Must have backend initialized and chain ran before retrieving chain")
\ No newline at end of file
+            raise ValueError("Must have backend initialized and chain ran before retrieving chain")
+
+
+def _sweep(conditional_fct, dim, pos, **kwargs):
+    """
+    This function does a single Gibbs sweep, updating pos in place
+
+    :param conditional_fct: the wrapped conditional function (or list of them) held by the model
+
+    :param dim: the dimension of the problem
+
+    :param pos: the numpy array position in parameter space that we update
+
+    :param kwargs: (optional) extra keyword args passed to the conditional function on this call only
+
+    :return: returns the updated position array
+    """
+    # Loop through each parameter dimension since Gibbs Sampling algorithm has us directly sample each
+    # parameter from the conditional probability functions:
+    if isinstance(conditional_fct, list):
+        for fct in conditional_fct:
+            pos[fct.idx] = fct(pos, fct.idx, **kwargs)
+    else:
+        for i in range(dim):
+            # find the new value for paramter i feom the conditinoal distribution
+            pos[i] = conditional_fct(pos, i, **kwargs)
+    return pos
+
+
+def _seed_global(conditional_fct, random):
+    """
+    This function seeds the global np.random from a random state if any of the conditional functions is numba
+    compiled, as those draw their random numbers from np.random instead of the random keyword argument
+
+    :param conditional_fct: the wrapped conditional function (or list of them) held by the model
+
+    :param random: the np.random.RandomState instance we draw the seed from
+
+    :return: This function does not return anything
+    """
+    fcts = conditional_fct if isinstance(conditional_fct, list) else [conditional_fct]
+    if any(getattr(fct, 'compiled', None) is not None for fct in fcts):
+        np.random.seed(random.randint(2**31))
+
+
+def _advance(make, n, stop, per_yield=1):
+    """
+    This function runs a sample generator of n steps until it is done or we are asked to stop. It is what
+    Sampler.asample runs in the executor
+
+    :param make: fct that returns the generator of Sampler.sample for n steps
+
+    :param n: the number of steps the generator runs
+
+    :param stop: a threading.Event, if it is set we stop after the current step
+
+    :param per_yield: (optional) the number of steps done for each state the generator yields (the chunk of the numba
+    engine). defaults to 1
+
+    :return: returns a tuple of the number of steps done and the last state yielded by the generator
+    """
+    steps = 0
+    results = None
+    gen = make()
+    try:
+        for results in gen:
+            steps = min(steps + per_yield, n)
+            if stop.is_set():
+                break
+        else:
+            steps = n
+    finally:
+        gen.close()
+    return steps, results
@@ -0,0 +1,228 @@
+# Copyright (C) 2018  Bruce Edelman
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import numpy as np
+
+"""
+This File sets up the storage policies that the Backend applies when a sample is written. Filtering policies (Discard,
+Thin) decide whether a sample is kept at all, and bounded policies (RingBuffer, Reservoir) decide where a kept sample goes
+in a fixed size chain so the memory of the backend stays bounded no matter how long we run the sampler
+"""
+
+
+class StoragePolicy(object):
+    """
+    This is the base class for the storage policies. A filtering policy only needs to implement accept() and count()
+    """
+    bounded = False
+
+    def __init__(self):
+        """
+        The initialization of the base storage policy. Sets the counter of samples this policy has seen
+        """
+        self.seen = 0
+
+    def reset(self):
+        """
+        This function resets the policy counters so it can be reused when the backend is reset
+
+        :return: This function does not return anything
+        """
+        self.seen = 0
+
+    def accept(self):
+        """
+        This function is called once for each sample that reaches this policy and decides if it is passed on
+
+        :return: True if the sample is kept, False if it is dropped
+        """
+        self.seen += 1
+        return True
+
+    def count(self, n):
+        """
+        This function counts how many of the next n samples will be accepted without changing the policy counters. It
+        is used by Backend.grow() to only allocate the space we will actually use
+
+        :param n: The number of samples that will reach this policy
+
+        :return: The number of those samples that will be accepted
+        """
+        return n
+
+
+class Discard(StoragePolicy):
+    """
+    Storage policy that drops the first k samples (burn-in) before they are ever written to the backend
+    """
+    def __init__(self, k):
+        """
+        The initialization of the Discard policy
+
+        :param k: The number of samples at the beginning of the chain that we do not store
+        """
+        super(Discard, self).__init__()
+        if int(k) < 0:
+            raise ValueError("Discard must be non-negative:")
+        self.k = int(k)
+
+    def accept(self):
+        """
+        Accepts a sample only once we have seen more than k samples
+
+        :return: True if the sample is kept, False if it is dropped
+        """
+        self.seen += 1
+        return self.seen > self.k
+
+    def count(self, n):
+        """
+        Counts how many of the next n samples are past the burn-in
+
+        :param n: The number of samples that will reach this policy
+
+        :return: The number of those samples that will be accepted
+        """
+        return max(0, n - max(0, self.k - self.seen))
+
+
+class Thin(StoragePolicy):
+    """
+    Storage policy that keeps only every k-th sample that reaches it
+    """
+    def __init__(self, k):
+        """
+        The initialization of the Thin policy
+
+        :param k: The factor we want to thin the chain by
+        """
+        super(Thin, self).__init__()
+        if int(k) <= 0:
+            raise ValueError("Thin must be strictly positive:")
+        self.k = int(k)
+
+    def accept(self):
+        """
+        Accepts a sample if it is the last of a block of k samples (same convention as Backend.get_attribute)
+
+        :return: True if the sample is kept, False if it is dropped
+        """
+        self.seen += 1
+        return self.seen % self.k == 0
+
+    def count(self, n):
+        """
+        Counts how many of the next n samples close a block of k samples
+
+        :param n: The number of samples that will reach this policy
+
+        :return: The number of those samples that will be accepted
+        """
+        return (self.seen + n) // self.k - self.seen // self.k
+
+
+class RingBuffer(StoragePolicy):
+    """
+    Bounded storage policy that keeps only the last `size` samples, overwriting the oldest one in place
+    """
+    bounded = True
+
+    def __init__(self, size):
+        """
+        The initialization of the RingBuffer policy
+
+        :param size: The number of samples we keep in the backend
+        """
+        super(RingBuffer, self).__init__()
+        if int(size) <= 0:
+            raise ValueError("Size of the storage must be strictly positive:")
+        self.size = int(size)
+
+    def slot(self):
+        """
+        This function decides where in the chain the next sample that reaches this policy is written
+
+        :return: the row index of the chain the sample is written to
+        """
+        idx = self.seen % self.size
+        self.seen += 1
+        return idx
+
+
+class Reservoir(StoragePolicy):
+    """
+    Bounded storage policy that keeps a uniformly drawn subset of `size` samples out of all the samples that reach it
+    (reservoir sampling, Algorithm R)
+    """
+    bounded = True
+
+    def __init__(self, size, random=None):
+        """
+        The initialization of the Reservoir policy
+
+        :param size: The number of samples we keep in the backend
+
+        :param random: (optional) a np.random.RandomState instance or seed used to pick the kept samples. This is kept
+        separate from the sampler's random state so the chain itself does not depend on the storage we choose
+        """
+        super(Reservoir, self).__init__()
+        if int(size) <= 0:
+            raise ValueError("Size of the storage must be strictly positive:")
+        self.size = int(size)
+        if isinstance(random, np.random.RandomState):
+            self.random = random
+        else:
+            self.random = np.random.RandomState(random)
+
+    def slot(self):
+        """
+        This function decides where in the chain the next sample that reaches this policy is written, if at all
+
+        :return: the row index of the chain the sample is written to or None if the sample is not kept
+        """
+        self.seen += 1
+        if self.seen <= self.size:
+            return self.seen - 1
+        j = self.random.randint(0, self.seen)
+        return j if j < self.size else None
+
+
+def as_policies(storage):
+    """
+    This function checks the storage policies passed to the backend and puts them in the order they are applied
+
+    :param storage: None, a single StoragePolicy instance or a list of them. Filtering policies are applied in the
+    order given and at most one bounded policy is allowed, which must come last
+
+    :return: returns a tuple of the list of filtering policies and the bounded policy (or None)
+    """
+    if storage is None:
+        return [], None
+    if isinstance(storage, StoragePolicy):
+        storage = [storage]
+
+    filters = []
+    bounded = None
+    for policy in storage:
+        if not isinstance(policy, StoragePolicy):
+            raise ValueError("Each storage policy must be an instance of StoragePolicy")
+        if bounded is not None:
+            raise ValueError("A bounded storage policy (RingBuffer, Reservoir) must be the last one given")
+        if policy.bounded:
+            bounded = policy
+        else:
+            filters.append(policy)
+    return filters, bounded
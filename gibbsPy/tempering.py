@@ -0,0 +1,246 @@
+# Copyright (C) 2018  Bruce Edelman
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 3 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import numpy as np
+from . import sampler
+from .pbar import *
+
+"""
+This File sets up the TemperedSampler class that does parallel tempering (replica exchange) Gibbs sampling. We run one
+replica of the chain at each temperature of a ladder, swap the states of neighbouring temperatures and only store the
+T=1 chain in the backend. The conditional functions must take a `beta` keyword argument (beta = 1/T) and sample from
+the tempered conditional p(x_i | x_-i)^beta, and we need the log posterior to decide on the swaps. The temperature
+ladder adaptation follows Vousden, Farr & Mandel (2016) as done in ptemcee. Only the T=1 chain is kept in the backend,
+so resuming from a backend brings back the T=1 position and random state but not the hotter replicas, the adapted
+ladder or the swap counters
+"""
+
+
+def default_betas(D, ntemps):
+    """
+    This function makes a geometric ladder of inverse temperatures with the T_(i+1)/T_i = 1 + sqrt(2/D) spacing that
+    gives a reasonable swap acceptance for a gaussian posterior in D dimensions
+
+    :param D: The dimension of the problem
+
+    :param ntemps: The number of temperatures in the ladder
+
+    :return: returns a numpy array of the inverse temperatures, starting at beta = 1
+    """
+    spacing = 1. + np.sqrt(2. / D)
+    return spacing ** -np.arange(ntemps)
+
+
+class TemperedSampler(sampler.Sampler):
+    """
+    This is the Sampler object that does parallel tempering gibbs sampling
+    """
+    def __init__(self, D, sampling_params=None, log_prob=None, ntemps=4, betas=None, swap_every=1, adapt=True,
+                 adapt_lag=10000, adapt_time=100, pool=None, **kwargs):
+        """
+        The intialization function called when we set up an instance of our tempered sampler object
+
+        :param D: The dimension of the problem we want to sample
+
+        :param sampling_params: (Optional) This is a list of strings with the name of each parameter we are sampling in.
+
+        :param log_prob: The log posterior (up to a constant) called as log_prob(pos, data). This is needed to accept or
+        reject the swaps between temperatures
+
+        :param ntemps: (optional) The number of temperatures in the ladder if betas is not given. defaults to 4
+
+        :param betas: (optional) numpy array of the inverse temperatures to use. The first must be 1, defaults to the
+        geometric ladder of default_betas()
+
+        :param swap_every: (optional) the number of steps between each round of swaps. defaults to 1
+
+        :param adapt: (optional) Bool, whether to adapt the temperature ladder from the swap acceptance rates so they are
+        even across the ladder. The smallest and largest temperatures are kept fixed. defaults to True
+
+        :param adapt_lag: (optional) the number of swap rounds over which the adaptation decays. defaults to 10000
+
+        :param adapt_time: (optional) the inverse of the initial amplitude of the adaptation. defaults to 100
+
+        :param pool: (optional) a pool object with a map method (e.g. multiprocessing.Pool) used to advance the replicas
+        in parallel. The conditional functions (and data) must then be picklable. defaults to None which advances the
+        replicas one after the other
+
+        :param kwargs: These are all passed to the Sampler initialization (initial_state, data, cond_fct, etc.). When
+        resuming from a backend (back=..., resume=True) every replica restarts from the stored T=1 position and the
+        ladder and swap counters start again from the values given here, so pass betas=previous_sampler.betas (and
+        adapt=False if the ladder should not move anymore) to keep an adapted ladder
+        """
+        super(TemperedSampler, self).__init__(D, sampling_params=sampling_params, **kwargs)
+
+        if log_prob is None:
+            raise ValueError("Must give the log_prob function to decide on swaps between temperatures:")
+        self.log_prob = log_prob
+
+        # Setup the temperature ladder
+        if betas is None:
+            betas = default_betas(self.dim, ntemps)
+        self.betas = np.array(betas, dtype=float)
+        if self.betas.ndim != 1 or len(self.betas) < 2:
+            raise ValueError("Must have at least two temperatures in the ladder:")
+        if self.betas[0] != 1. or np.any(np.diff(self.betas) >= 0) or self.betas[-1] <= 0:
+            raise ValueError("Betas must start at 1 and be strictly decreasing and positive:")
+        self.ntemps = len(self.betas)
+
+        if int(swap_every) <= 0:
+            raise ValueError("Swap_every must be strictly positive:")
+        self.swap_every = int(swap_every)
+        self.adapt = adapt
+        self.adapt_lag = adapt_lag
+        self.adapt_time = adapt_time
+        self.pool = pool
+
+        # Each replica gets its own random state seeded from the sampler's so they can be advanced in parallel
+        self._replica_randoms = [np.random.RandomState(self._random.randint(2**31)) for _ in range(self.ntemps)]
+        self._replicas = [np.array(self._previous_state.pos, dtype=float) for _ in range(self.ntemps)]
+        self._replicas[0] = self._previous_state.pos
+
+        # keep track of the swaps between each pair of neighbouring temperatures
+        self.nswap = np.zeros(self.ntemps - 1)
+        self.nswap_accepted = np.zeros(self.ntemps - 1)
+        self._nrounds = 0
+
+    @property
+    def swap_acceptance(self):
+        """
+        The fraction of the swaps between each pair of neighbouring temperatures that were accepted
+
+        :return: numpy array of length ntemps - 1
+        """
+        return self.nswap_accepted / np.maximum(self.nswap, 1)
+
+    def sample(self, initial, n, store=False, thin=1, progress=False):
+        """
+        This is the Generator for sampling the T=1 chain while running the other temperatures alongside it
+
+        :param initial: THis is the initial state of the T=1 chain must be an instance of State object
+
+        :param n: Number of steps to evovle our chain
+
+        :param store: (optional) bool value that sets whether we store the T=1 values in the backend or not defaults to
+        False
+
+        :param thin: (optional) The number of gibbs sweeps every replica does for each step. defaults to no thinning
+        (thin = 1)
+
+        :param progress: (optional) Boolean value that decides whether or not to show a progress bar during sampling.
+        defaults to False
+
+        :return: This is a generator so it yields the State object of the T=1 chain at each step
+        """
+        newState = initial
+        if newState.pos is not self._replicas[0]:
+            self._replicas[0] = newState.pos
+
+        if store:
+            self.backend.grow(n)
+        thin = int(thin)
+        if thin <= 0:
+            raise ValueError("Thin must be strictly positive:")
+
+        with progress_bar(progress, n * thin) as prog_bar:
+            for step in range(n):
+                self._advance_replicas(thin)
+                prog_bar.update(thin)
+
+                if (step + 1) % self.swap_every == 0:
+                    self._swap()
+
+                if store:
+                    self.backend.save_sample(newState)
+                yield newState
+
+    def _advance_replicas(self, nsweeps):
+        """
+        This function advances every replica by nsweeps gibbs sweeps at its own temperature
+
+        :param nsweeps: The number of sweeps to do
+
+        :return: This function does not return anything, the replicas are updated in place
+        """
+        if self.pool is None:
+            for pos, beta, rng in zip(self._replicas, self.betas, self._replica_randoms):
+                sampler._seed_global(self.conditional_fct, rng)
+                for _ in range(nsweeps):
+                    sampler._sweep(self.conditional_fct, self.dim, pos, beta=beta, random=rng)
+        else:
+            tasks = [(self.conditional_fct, self.dim, pos, beta, rng.get_state(), nsweeps)
+                     for pos, beta, rng in zip(self._replicas, self.betas, self._replica_randoms)]
+            for k, (pos, ranstate) in enumerate(self.pool.map(_advance_replica, tasks)):
+                self._replicas[k][:] = pos
+                self._replica_randoms[k].set_state(ranstate)
+
+    def _swap(self):
+        """
+        This function proposes swapping the states of each pair of neighbouring temperatures, from the hottest down to
+        the T=1 chain, and adapts the ladder if we are adapting
+
+        :return: This function does not return anything, the replicas are swapped in place
+        """
+        logp = np.array([self.log_prob(pos, self.data) for pos in self._replicas])
+        ratios = np.zeros(self.ntemps - 1)
+
+        for i in range(self.ntemps - 2, -1, -1):
+            log_accept = (self.betas[i] - self.betas[i + 1]) * (logp[i + 1] - logp[i])
+            ratios[i] = np.exp(min(0., log_accept))
+            self.nswap[i] += 1
+            if np.log(self._random.uniform()) < log_accept:
+                self.nswap_accepted[i] += 1
+                hot = np.copy(self._replicas[i + 1])
+                self._replicas[i + 1][:] = self._replicas[i]
+                self._replicas[i][:] = hot
+                logp[i], logp[i + 1] = logp[i + 1], logp[i]
+
+        self._nrounds += 1
+        if self.adapt and self.ntemps > 2:
+            self._update_betas(ratios)
+
+    def _update_betas(self, ratios):
+        """
+        This function moves the intermediate temperatures so that the swap acceptance is the same for every pair of
+        neighbouring temperatures
+
+        :param ratios: numpy array of the swap acceptance probabilities of the last round of swaps
+
+        :return: This function does not return anything, self.betas is updated in place
+        """
+        kappa = self.adapt_lag / (self._nrounds + self.adapt_lag) / self.adapt_time
+        dlogT = kappa * (ratios[:-1] - ratios[1:])
+
+        deltaT = np.diff(1. / self.betas[:-1]) * np.exp(dlogT)
+        self.betas[1:-1] = 1. / (np.cumsum(deltaT) + 1. / self.betas[0])
+
+
+def _advance_replica(args):
+    """
+    This function advances a single replica by a number of gibbs sweeps. It is what TemperedSampler maps over the pool
+
+    :param args: tuple of (conditional_fct, dim, pos, beta, random state tuple, nsweeps)
+
+    :return: returns a tuple of the new position and the new random state tuple of the replica
+    """
+    conditional_fct, dim, pos, beta, ranstate, nsweeps = args
+    rng = np.random.RandomState()
+    rng.set_state(ranstate)
+    pos = np.array(pos, dtype=float)
+    sampler._seed_global(conditional_fct, rng)
+    for _ in range(nsweeps):
+        sampler._sweep(conditional_fct, dim, pos, beta=beta, random=rng)
+    return pos, rng.get_state()
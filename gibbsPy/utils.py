@@ -18,8 +18,8 @@
 This file sets up useful utility functions and/or classes to be used in other files of gibbsPy
 """
 import numpy as np
-import corner
 import matplotlib.pyplot as plt
+from . import diagnostics
 
 class _FnWrap(object):
     """
@@ -48,11 +48,14 @@ class _FnWrap(object):
             if arg is not None:
                 self.args.append(arg)
         self.kwargs = {} if kwargs is None else kwargs
-        self.function = func
+        # numba compiled functions can not take our RandomState so we call their python version here, the compiled
+        # engine (compiled.py) uses the compiled function itself
+        self.function = getattr(func, 'py_func', func)
+        self.compiled = func if hasattr(func, 'py_func') else None
         self.data = data
         self.random = random if random is not None else None
 
-    def __call__(self, x, idx):
+    def __call__(self, x, idx, **kwargs):
         """
         The call for our function after it is wrapped
 
@@ -60,10 +63,15 @@ class _FnWrap(object):
 
         :param idx: The index of the parameter we wish to evaluate at
 
+        :param kwargs: (optional) keyword arguments passed to the function on this call only. These take priority over
+        the wrapped kwargs (a random kwarg here also replaces the wrapped random state)
+
         :return:retuns the output of the wrapped function
         """
+        random = kwargs.pop('random', self.random)
+        kwargs = dict(self.kwargs, **kwargs)
         try:
-            return self.function(x, idx, self.data, random=self.random, *self.args, *self.kwargs)
+            return self.function(x, idx, self.data, *self.args, random=random, **kwargs)
         except:
             import traceback
             print("gibbsPy: Exception while calling your likelihood function:")
@@ -75,75 +83,272 @@ class _FnWrap(object):
             raise
 
 def compute_acl(chain):
-    pass
+    """
+    This function computes the autocorrelation length of the chain, the number of steps between independent samples
+
+    :param chain: numpy array of the chain of shape (draws, D), or anything accepted by the diagnostics module
+
+    :return: returns a numpy array of length D of the autocorrelation length (integer) of each parameter
+    """
+    return np.ceil(compute_act(chain)).astype(int)
 
 def compute_act(chain):
-    pass
+    """
+    This function computes the integrated autocorrelation time of the chain using diagnostics.autocorr_time()
+
+    :param chain: numpy array of the chain of shape (draws, D), or anything accepted by the diagnostics module
+
+    :return: returns a numpy array of length D of the autocorrelation time of each parameter
+    """
+    return diagnostics.autocorr_time(chain)
+
+def _source(chain):
+    """
+    This function sets up chunked reading of a chain
+
+    :param chain: numpy array of the chain of shape (draws, D), or a Backend or Sampler
+
+    :return: returns a tuple of (number of draws, D, read(lo, hi) fct that returns the draws lo to hi, the backend or
+    None)
+    """
+    if hasattr(chain, 'backend'):
+        chain = chain.backend
+    if hasattr(chain, 'get_chain'):
+        return chain.iteration, chain.dim, lambda lo, hi: chain.get_chain(window=(lo, hi)), chain
+    chain = np.asarray(chain)
+    return len(chain), chain.shape[1], lambda lo, hi: chain[lo:hi], None
+
+
+def _ranges(n, D, read, back, chunk):
+    """
+    This function finds the range of each parameter, from the block summaries of a backend or a chunked pass over the
+    chain
+
+    :param n: the number of draws
+
+    :param D: the dimension of the chain
+
+    :param read: the read(lo, hi) fct from _source()
+
+    :param back: the backend from _source() or None
+
+    :param chunk: the number of draws read at once
+
+    :return: returns a list of D (min, max) tuples
+    """
+    # the summaries only cover the whole chain if no blocks were dropped (max_blocks)
+    if back is not None and back.bounded is None and not back.filters and \
+            (back.max_blocks is None or back.nblocks <= back.max_blocks):
+        summary = back.get_summary()
+        lo, hi = summary['min'].min(axis=0), summary['max'].max(axis=0)
+    else:
+        lo, hi = np.full(D, np.inf), np.full(D, -np.inf)
+        for start in range(0, n, chunk):
+            rows = read(start, start + chunk)
+            lo, hi = np.minimum(lo, rows.min(axis=0)), np.maximum(hi, rows.max(axis=0))
+    # give constant parameters a finite range
+    pad = np.where(hi > lo, 0., 0.5)
+    return list(zip(lo - pad, hi + pad))
+
+
+def histograms(chain, bins=50, ranges=None, pairs=True, chunk=1000000):
+    """
+    This function builds the 1d histogram of each parameter and the 2d histogram of each pair of parameters reading the
+    chain in chunks, so it works on chains too large to histogram (or hold) at once
+
+    :param chain: numpy array of the chain of shape (draws, D), or a Backend or Sampler
+
+    :param bins: (optional) the number of bins along each parameter, defaults to 50
+
+    :param ranges: (optional) list of D (min, max) tuples. defaults to None which uses the range of the samples
+
+    :param pairs: (optional) Bool, whether to also build the 2d histograms, defaults to True
+
+    :param chunk: (optional) the number of draws read at once, defaults to 1000000
+
+    :return: returns a tuple of (list of the D bin edges, list of the D 1d counts, dictionary of the 2d counts with key
+    (i, j) for i < j)
+    """
+    n, D, read, back = _source(chain)
+    if ranges is None:
+        ranges = _ranges(n, D, read, back, chunk)
+    edges = [np.linspace(lo, hi, bins + 1) for lo, hi in ranges]
+    counts = [np.zeros(bins) for _ in range(D)]
+    counts2d = dict(((i, j), np.zeros((bins, bins))) for j in range(D) for i in range(j)) if pairs else {}
+
+    for start in range(0, n, chunk):
+        rows = read(start, start + chunk)
+        for i in range(D):
+            counts[i] += np.histogram(rows[:, i], bins=edges[i])[0]
+        for (i, j), H in counts2d.items():
+            H += np.histogram2d(rows[:, i], rows[:, j], bins=(edges[i], edges[j]))[0]
+    return edges, counts, counts2d
+
+
+def decimate(chain, max_points=5000, chunk=1000000):
+    """
+    This function decimates the chain for trace plots, keeping the min and max of each parameter in each of (at most)
+    max_points buckets of consecutive draws so the spikes of the trace are not lost
+
+    :param chain: numpy array of the chain of shape (draws, D), or a Backend or Sampler
+
+    :param max_points: (optional) the maximum number of buckets, defaults to 5000
 
-def plot_corner(chain, labels, trues=None, file=None):
+    :param chunk: (optional) the number of draws read at once (rounded to a whole number of buckets), defaults to
+    1000000
+
+    :return: returns a tuple of (numpy array of the first draw of each bucket, (nbuckets, D) array of the min of each
+    bucket, (nbuckets, D) array of the max of each bucket)
     """
+    n, D, read, back = _source(chain)
+    width = max(1, -(-n // max_points))
+    chunk = max(1, chunk // width) * width
+
+    lo, hi = [], []
+    for start in range(0, n, chunk):
+        rows = read(start, start + chunk)
+        nb = -(-len(rows) // width)
+        padded = np.full((nb * width, D), np.nan)
+        padded[:len(rows)] = rows
+        padded = padded.reshape(nb, width, D)
+        lo.append(np.nanmin(padded, axis=1))
+        hi.append(np.nanmax(padded, axis=1))
+    return np.arange(0, n, width), np.concatenate(lo), np.concatenate(hi)
 
-    :param chain:
-    :param labels:
-    :param trues:
-    :param file:
-    :return:
+
+def _quantiles(edges, counts, q):
     """
-    fig = corner.corner(chain, range=[(0., 1.), (0., 1.), (0., 1.), (0., 1.)], labels=labels, show_titles=True,
-                        quantities=(0.05, 0.95))
+    This function finds quantiles from a histogram by interpolating its cumulative distribution
+
+    :param edges: the bin edges
+
+    :param counts: the counts of each bin
+
+    :param q: list of the quantiles we want
+
+    :return: numpy array of the quantiles
+    """
+    cdf = np.concatenate(([0.], np.cumsum(counts)))
+    return np.interp(np.asarray(q) * cdf[-1], cdf, edges)
+
+
+def plot_corner(chain, labels, trues=None, file=None, bins=50, ranges=None, chunk=1000000):
+    """
+    This function makes a corner plot of the chain from histograms built in chunks (see histograms()) so it works for
+    any number of parameters and very long chains
+
+    :param chain: numpy array of the chain of shape (draws, D), or a Backend or Sampler
+
+    :param labels: list of the D labels of the parameters
+
+    :param trues: (optional) list of the D true values of the parameters to mark on the plot
+
+    :param file: (optional) file name to save the figure to
+
+    :param bins: (optional) the number of bins along each parameter, defaults to 50
+
+    :param ranges: (optional) list of D (min, max) tuples. defaults to None which uses the range of the samples
+
+    :param chunk: (optional) the number of draws read at once, defaults to 1000000
+
+    :return: returns the matplotlib figure
+    """
+    edges, counts, counts2d = histograms(chain, bins=bins, ranges=ranges, chunk=chunk)
     dim = len(labels)
-    # Extract the axes
-    axes = np.array(fig.axes).reshape((dim, dim))
-    if trues is not None:
-        # Loop over the diagonal
-        for i in range(dim):
-            ax = axes[i, i]
-            ax.axvline(trues[i], color="g")
-        # Loop over the histograms
-        for yi in range(dim):
-            for xi in range(yi):
-                ax = axes[yi, xi]
-                ax.axvline(trues[xi], color="g")
-                ax.axhline(trues[yi], color="g")
-                ax.plot(trues[xi], trues[yi], "sg")
-    plt.show()
+    fig, axes = plt.subplots(nrows=dim, ncols=dim, figsize=(2.5 * dim, 2.5 * dim), squeeze=False)
+    fig.subplots_adjust(hspace=0.1, wspace=0.1)
+
+    for yi in range(dim):
+        for xi in range(dim):
+            ax = axes[yi, xi]
+            if xi > yi:
+                ax.set_axis_off()
+                continue
+            if xi == yi:
+                # the 1d histogram with the median and 5%-95% interval
+                ax.hist(edges[xi][:-1], bins=edges[xi], weights=counts[xi], histtype='step', color='k')
+                q = _quantiles(edges[xi], counts[xi], (0.05, 0.5, 0.95))
+                for v in q:
+                    ax.axvline(v, color='k', ls='--', lw=0.8)
+                ax.set_title('{0} = ${1:.3g}_{{-{2:.2g}}}^{{+{3:.2g}}}$'.format(labels[xi], q[1], q[1] - q[0],
+                                                                                  q[2] - q[1]))
+                ax.set_yticks([])
+                if trues is not None:
+                    ax.axvline(trues[xi], color="g")
+            else:
+                ax.pcolormesh(edges[xi], edges[yi], counts2d[(xi, yi)].T, cmap='Greys')
+                if trues is not None:
+                    ax.axvline(trues[xi], color="g")
+                    ax.axhline(trues[yi], color="g")
+                    ax.plot(trues[xi], trues[yi], "sg")
+                if xi > 0:
+                    ax.set_yticklabels([])
+                else:
+                    ax.set_ylabel(labels[yi])
+            ax.set_xlim(edges[xi][0], edges[xi][-1])
+            if yi < dim - 1:
+                ax.set_xticklabels([])
+            else:
+                ax.set_xlabel(labels[xi])
+
     if file is not None:
         plt.savefig(file)
+    plt.show()
+    return fig
 
 
-def plot_trace(chain, labels, trues=None, file=None):
+def plot_trace(chain, labels, trues=None, file=None, bins=50, max_points=5000, chunk=1000000):
     """
+    This function plots the histogram and the trace of each parameter. The histograms are built in chunks and the
+    traces are min/max decimated (see histograms() and decimate()) so this is fast for very long chains
+
+    :param chain: numpy array of the chain of shape (draws, D), or a Backend or Sampler
 
-    :param chain:
-    :param labels:
-    :param trues:
-    :param file:
-    :return:
+    :param labels: list of the D labels of the parameters
+
+    :param trues: (optional) list of the D true values of the parameters to mark on the plot
+
+    :param file: (optional) file name to save the figure to
+
+    :param bins: (optional) the number of bins of the histograms, defaults to 50
+
+    :param max_points: (optional) the maximum number of points of each trace, defaults to 5000
+
+    :param chunk: (optional) the number of draws read at once, defaults to 1000000
+
+    :return: returns the matplotlib figure
     """
+    edges, counts, _ = histograms(chain, bins=bins, pairs=False, chunk=chunk)
+    steps, lo, hi = decimate(chain, max_points=max_points, chunk=chunk)
     dim = len(labels)
-    fig, axs = plt.subplots(nrows=dim, ncols=2, figsize=(10, 15))
+    fig, axs = plt.subplots(nrows=dim, ncols=2, figsize=(10, 3 * dim), squeeze=False)
     fig.subplots_adjust(hspace=0.75)
     for i in range(dim):
         ax = axs[i][0]
         ax.set_title('%s histogram' % labels[i])
-        ax.hist(chain[:, i], bins=50, density=True, alpha=0.5)
+        width = np.diff(edges[i])
+        ax.hist(edges[i][:-1], bins=edges[i], weights=counts[i] / (counts[i].sum() * width), alpha=0.5)
         if trues is not None:
             ax.axvline(trues[i], color='r', label=r'$\theta_{true}$')
-        ax.set_xlim(0, 1)
+            ax.legend()
+        ax.set_xlim(edges[i][0], edges[i][-1])
         ax.set_xlabel(labels[i])
         ax.set_ylabel('density')
-        ax.legend()
         ax = axs[i][1]
-        ax.set_ylim(0, 1)
+        ax.set_ylim(edges[i][0], edges[i][-1])
         ax.set_title('%s Traceplot' % labels[i])
         ax.set_xlabel('Iteration')
         ax.set_ylabel(labels[i])
         if trues is not None:
             ax.axhline(trues[i], color='r', label=r'$\theta_{true}$')
-        ax.plot(chain[:, i], alpha=0.4)
-        ax.legend()
+            ax.legend()
+        if np.array_equal(lo[:, i], hi[:, i]):
+            ax.plot(steps, lo[:, i], alpha=0.4)
+        else:
+            ax.fill_between(steps, lo[:, i], hi[:, i], alpha=0.4, step='post', lw=0)
 
     plt.suptitle('GibbsPy TracePlot')
-    plt.show()
     if file is not None:
         plt.savefig(file)
+    plt.show()
+    return fig
@@ -0,0 +1,61 @@
+import asyncio
+import numpy as np
+import pytest
+from gibbsPy import sampler
+
+
+def _conditional(pos, idx, data, random=None):
+    return random.normal(0.5 * pos[1 - idx], 1.)
+
+
+def _sampler():
+    return sampler.Sampler(2, None, initial_state=np.zeros(2), cond_fct=_conditional, random=np.random.RandomState(0))
+
+
+def test_callback_reports_cumulative_steps():
+    s = _sampler()
+    progress = []
+    asyncio.run(s.arun(1000, batch=300, callback=lambda done, n: progress.append((done, n))))
+    assert progress == [(300, 1000), (600, 1000), (900, 1000), (1000, 1000)]
+    assert s.backend.iteration == 1000
+
+
+def test_asample_yields_once_per_batch():
+    s = _sampler()
+
+    async def run():
+        return [np.copy(st.pos) async for st in s.asample(s._previous_state, 250, batch=100, store=True)]
+
+    states = asyncio.run(run())
+    assert len(states) == 3
+    # the state after each batch is the last stored sample of that batch
+    assert np.array_equal(states, s.get_chain()[[99, 199, 249]])
+
+
+def test_same_chain_as_run_gibs():
+    a = _sampler()
+    asyncio.run(a.arun(200, batch=30))
+    b = _sampler()
+    b.run_gibs(200)
+    assert np.array_equal(a.get_chain(), b.get_chain())
+
+
+def test_cancel_then_resume():
+    s = _sampler()
+
+    async def run():
+        task = asyncio.ensure_future(s.arun(100000, batch=50, callback=lambda done, n: done >= 200 and task.cancel()))
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    # the run stops after the step it was doing when cancelled, the backend only grew by the batches that ran and
+    # every stored sample is accounted for
+    n = s.backend.iteration
+    assert n == s.backend.nsteps
+    assert 200 <= n <= 250
+    assert len(s.backend.chain) <= 250
+
+    s.run_gibs(10)
+    assert s.backend.iteration == s.backend.nsteps == n + 10
+    assert np.all(np.isfinite(s.get_chain()))
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from gibbsPy import backend, state, storage
+
+
+def _backend(n, policy=None, **kwargs):
+    rs = np.random.RandomState(0)
+    rows = rs.normal(size=(n, 3))
+    b = backend.Backend(storage=policy, **kwargs)
+    b.reset(3, params=['a', 'b', 'c'])
+    b.grow(n)
+    for row in rows:
+        b.save_sample(state.State(row.copy()))
+    return b, rows
+
+
+def test_params_window_discard_thin():
+    b, rows = _backend(50)
+    assert np.array_equal(b.get_chain(), rows)
+    assert np.array_equal(b.get_chain(params=['c', 'a']), rows[:, [2, 0]])
+    assert np.array_equal(b.get_chain(params='b', window=(10, 30)), rows[10:30, [1]])
+    assert np.array_equal(b.get_chain(discard=5, thin=3), rows[7::3])
+    with pytest.raises(ValueError):
+        b.get_chain(params=['d'])
+
+
+def test_get_chain_is_a_view():
+    b, _ = _backend(20)
+    assert np.shares_memory(b.get_chain(), b.chain)
+
+
+def test_summary_matches_chain():
+    b, rows = _backend(53, summary_block=10)
+    summary = b.get_summary()
+    assert np.array_equal(summary['start'], np.arange(0, 60, 10))
+    assert np.array_equal(summary['count'], [10, 10, 10, 10, 10, 3])
+    for i, (start, count) in enumerate(zip(summary['start'], summary['count'])):
+        block = rows[start:start + count]
+        assert np.allclose(summary['min'][i], block.min(axis=0))
+        assert np.allclose(summary['max'][i], block.max(axis=0))
+        assert np.allclose(summary['mean'][i], block.mean(axis=0))
+        assert np.allclose(summary['var'][i], block.var(axis=0))
+    assert np.allclose(b.get_summary(params=['b'])['mean'], summary['mean'][:, [1]])
+
+
+def test_summary_bounded_storage():
+    b, rows = _backend(95, policy=storage.RingBuffer(10), summary_block=10, max_blocks=3)
+    summary = b.get_summary()
+    # only the last 3 full blocks and the partial one are kept, and they cover samples the ring no longer holds
+    assert np.array_equal(summary['start'], [60, 70, 80, 90])
+    assert np.allclose(summary['mean'][0], rows[60:70].mean(axis=0))
+    assert np.allclose(summary['max'][-1], rows[90:95].max(axis=0))
+    assert len(b.block_mean) == 3
@@ -0,0 +1,51 @@
+import copy
+import numpy as np
+import pytest
+from gibbsPy import collapsed
+
+
+def _mixture(seed=0):
+    rs = np.random.RandomState(seed)
+    return np.concatenate((rs.normal(-3, 1, 40), rs.normal(3, 1, 40)))
+
+
+def test_tables_match_rebuild():
+    data = _mixture()
+    s = collapsed.CollapsedSampler(data, collapsed.GaussianStats(2, tau0=5.), random=np.random.RandomState(1))
+    s.run_gibs(20)
+    likelihood, weights = copy.deepcopy(s.likelihood), copy.deepcopy(s.weights)
+
+    # the incrementally updated statistics are the same as the ones built from scratch from the last state
+    s._build_tables(s._previous_state.pos)
+    assert np.allclose(likelihood.n, s.likelihood.n)
+    assert np.allclose(likelihood.sum, s.likelihood.sum)
+    assert np.allclose(weights.counts, s.weights.counts)
+    assert s.weights.counts.sum() == len(data)
+
+
+def test_count_table_groups():
+    rs = np.random.RandomState(2)
+    words = rs.randint(5, size=60)
+    groups = np.repeat(np.arange(3), 20)
+    s = collapsed.CollapsedSampler(words, collapsed.CountTable(2, 5),
+                                   weights=collapsed.DirichletWeights(2, groups=groups), random=rs)
+    s.run_gibs(5)
+    counts = s.likelihood.counts.copy()
+    s._build_tables(s._previous_state.pos)
+    assert np.array_equal(counts, s.likelihood.counts)
+    assert np.array_equal(s.weights.counts.sum(axis=1), [20, 20, 20])
+
+
+def test_separates_components():
+    data = _mixture(3)
+    s = collapsed.CollapsedSampler(data, collapsed.GaussianStats(2, tau0=5.), random=np.random.RandomState(4))
+    s.run_gibs(30)
+    z = s._previous_state.pos.astype(int)
+    # up to label switching, each half of the data ends up in its own component
+    agree = np.mean(z[:40] == z[0]) + np.mean(z[40:] != z[0])
+    assert agree > 1.9
+
+
+def test_sufficient_stats_is_abstract():
+    with pytest.raises(TypeError):
+        collapsed.SufficientStats(2)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from gibbsPy import sampler, storage
+
+numba = pytest.importorskip('numba')
+
+
+def _conditional(pos, idx, data, random=None):
+    return np.random.normal(0.5 * pos[(idx + 1) % len(pos)], 1.)
+
+
+def _uncompilable(pos, idx, data, random=None):
+    import scipy.stats
+    return random.normal()
+
+
+@numba.njit
+def _beta_bernoulli(pos, idx, data, random=None):
+    return np.random.beta(1. + data.sum(), 1. + len(data) - data.sum())
+
+
+def _sampler(fct=_conditional, data=None, **kwargs):
+    return sampler.Sampler(3, None, initial_state=np.zeros(3), cond_fct=fct, data=data,
+                           random=np.random.RandomState(3), **kwargs)
+
+
+def test_same_seed_same_chain():
+    chains = []
+    for _ in range(2):
+        s = _sampler()
+        s.run_gibs(500, engine='numba', chunk=70)
+        chains.append(s.get_chain())
+    assert np.array_equal(chains[0], chains[1])
+
+
+def test_engines_store_the_same_rows():
+    compiled = _sampler()
+    compiled.run_gibs(250, engine='numba', chunk=100, thin=2)
+    python = _sampler()
+    python.run_gibs(250, thin=2)
+
+    assert compiled.backend.iteration == python.backend.iteration == 250
+    assert compiled.backend.nsteps == python.backend.nsteps
+    assert np.array_equal(compiled.backend.get_attribute('steps'), python.backend.get_attribute('steps'))
+    assert np.array_equal(compiled.get_chain()[-1], compiled.backend.get_last_sample().pos)
+    # both sample the same gaussian, x_i = 0.5 x_(i+1) + noise has variance 4 / 3
+    assert np.allclose(np.var(compiled.get_chain(), axis=0), 4. / 3., rtol=0.3)
+
+
+def test_fallback_warns():
+    s = _sampler(_uncompilable)
+    with pytest.warns(UserWarning, match='python engine'):
+        s.run_gibs(10, engine='numba')
+    assert s.backend.iteration == 10
+
+
+def test_storage_policies_fall_back():
+    s = _sampler(storage=storage.Thin(2))
+    with pytest.warns(UserWarning, match='storage policies'):
+        s.run_gibs(10, engine='numba')
+    assert s.backend.iteration == 5
+
+
+def test_python_engine_reproducible_with_njit_conditional():
+    data = (np.random.RandomState(5).uniform(size=50) < 0.3).astype(float)
+    chains = []
+    for _ in range(2):
+        s = _sampler(_beta_bernoulli, data=data)
+        s.run_gibs(100)
+        chains.append(s.get_chain())
+    assert np.array_equal(chains[0], chains[1])
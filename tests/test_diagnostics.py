@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from gibbsPy import backend, diagnostics, state
+
+
+def _ar1(seed, m=4, n=500, phi=(0.0, 0.5, 0.9)):
+    rs = np.random.RandomState(seed)
+    phi = np.asarray(phi)
+    e = rs.normal(size=(m, n, len(phi)))
+    x = np.empty_like(e)
+    x[:, 0] = e[:, 0]
+    for t in range(1, n):
+        x[:, t] = phi * x[:, t - 1] + e[:, t]
+    return x
+
+
+# reference values computed with ArviZ 0.23 (az.rhat, az.ess and az.mcse for each parameter)
+RHAT = [1.0026575106250382, 1.0061588546742009, 1.0548901526028367]
+ESS_BULK = [1929.8850296328471, 644.2370470794135, 96.33924954763796]
+ESS_TAIL = [1700.6927458125413, 1252.3574297021514, 274.604390684604]
+MCSE_MEAN = [0.02282150644397994, 0.04510632882713538, 0.2189168735260668]
+MCSE_Q30 = [0.03021997623303119, 0.05930869988262311, 0.21712648535621926]
+# single chain values, ess_bulk and ess_tail of the first chain
+ESS_BULK_1 = [488.7556965495841, 101.02932338258546, 32.473199720450125]
+ESS_TAIL_1 = [463.3331822150212, 267.1860901452677, 45.18959200408345]
+
+
+def test_against_arviz():
+    x = _ar1(42)
+    assert np.allclose(diagnostics.rhat(x), RHAT, rtol=1e-10)
+    assert np.allclose(diagnostics.ess_bulk(x), ESS_BULK, rtol=1e-10)
+    assert np.allclose(diagnostics.ess_tail(x), ESS_TAIL, rtol=1e-10)
+    assert np.allclose(diagnostics.mcse_mean(x), MCSE_MEAN, rtol=1e-10)
+    assert np.allclose(diagnostics.mcse_quantile(x, 0.3), MCSE_Q30, rtol=1e-10)
+    assert np.allclose(diagnostics.ess_bulk(x[0]), ESS_BULK_1, rtol=1e-10)
+    assert np.allclose(diagnostics.ess_tail(x[0]), ESS_TAIL_1, rtol=1e-10)
+
+
+def test_summary_and_inputs_agree():
+    x = _ar1(7)
+    summary = diagnostics.summary(x, block=2)
+    assert np.allclose(summary['rhat'], diagnostics.rhat(x))
+    assert np.allclose(summary['ess_bulk'], diagnostics.ess_bulk(x))
+    assert np.allclose(summary['mean'], x.mean(axis=(0, 1)))
+    # a list of (draws, D) chains is the same as the (chains, draws, D) array
+    assert np.allclose(diagnostics.ess_tail(list(x)), diagnostics.ess_tail(x))
+
+
+def test_iid_chains():
+    x = np.random.RandomState(3).normal(size=(4, 2000, 2))
+    assert np.all(np.abs(diagnostics.rhat(x) - 1) < 0.01)
+    assert np.all(np.abs(diagnostics.ess_bulk(x) / 8000. - 1) < 0.15)
+    assert np.all(np.abs(diagnostics.autocorr_time(x) - 1) < 0.15)
+
+
+def test_constant_chain():
+    x = np.ones((2, 100, 1))
+    assert np.array_equal(diagnostics.ess_bulk(x), [1.])
+
+
+def test_batch_summary():
+    x = _ar1(11, m=2, n=20000)
+    backends = []
+    for chain in x:
+        b = backend.Backend(summary_block=500)
+        b.reset(3)
+        b.grow(len(chain))
+        b.chain[:len(chain)] = chain
+        b.save_written(len(chain), state.State(chain[-1].copy()))
+        backends.append(b)
+
+    fast = diagnostics.batch_summary(backends)
+    full = diagnostics.summary(backends)
+    assert fast['draws'] == 20000
+    assert np.allclose(fast['mean'], full['mean'])
+    assert np.allclose(fast['sd'], full['sd'])
+    assert np.allclose(fast['rhat'], full['rhat'], atol=0.01)
+    assert np.allclose(fast['ess'], 40000. / diagnostics.autocorr_time(backends), rtol=0.2)
+    assert np.allclose(fast['mcse_mean'], full['mcse_mean'], rtol=0.2)
+
+
+def test_too_few_draws():
+    with pytest.raises(ValueError):
+        diagnostics.rhat(np.zeros((3, 2)))
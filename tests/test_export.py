@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from gibbsPy import export, sampler, storage
+
+
+def _conditional(pos, idx, data, random=None):
+    return random.normal(0.5 * pos[(idx + 1) % len(pos)], 1.)
+
+
+def _sampler(policy=None, back=None):
+    if back is not None:
+        return sampler.Sampler(3, None, cond_fct=_conditional, back=back, resume=True)
+    return sampler.Sampler(3, None, initial_state=np.zeros(3), cond_fct=_conditional,
+                           random=np.random.RandomState(3), storage=policy)
+
+
+POLICIES = {'none': lambda: None,
+            'discard': lambda: storage.Discard(30),
+            'thin': lambda: storage.Thin(3),
+            'ring': lambda: storage.RingBuffer(50),
+            'reservoir': lambda: storage.Reservoir(50, random=1),
+            'thin_ring': lambda: [storage.Thin(2), storage.RingBuffer(40)]}
+
+
+def _roundtrip(fmt, s, tmp_path):
+    path = str(tmp_path / ('chains.' + fmt))
+    if fmt == 'npz':
+        export.to_npz(path, s)
+        return export.from_npz(path)
+    pytest.importorskip('pyarrow')
+    if fmt == 'arrow':
+        export.to_arrow(path, s)
+        return export.from_arrow(path)
+    export.to_parquet(path, s)
+    return export.from_parquet(path)
+
+
+@pytest.mark.parametrize('fmt', ['npz', 'arrow', 'parquet'])
+@pytest.mark.parametrize('name', sorted(POLICIES))
+def test_roundtrip_then_resume(fmt, name, tmp_path):
+    s = _sampler(POLICIES[name]())
+    s.run_gibs(200)
+    b = _roundtrip(fmt, s, tmp_path)[0]
+
+    assert b.params == s.backend.params
+    assert np.array_equal(b.get_chain(), s.get_chain())
+    assert np.array_equal(b.get_attribute('steps'), s.backend.get_attribute('steps'))
+
+    # resuming the imported backend continues exactly like the original
+    s.run_gibs(10)
+    resumed = _sampler(back=b)
+    resumed.run_gibs(10)
+    assert np.array_equal(resumed.get_chain(), s.get_chain())
+    assert resumed.backend.accepted == s.backend.accepted
+    assert len(resumed.backend.chain) == len(s.backend.chain)
+
+
+def test_resume_ring_buffer_stays_bounded(tmp_path):
+    s = _sampler(storage.RingBuffer(50))
+    s.run_gibs(200)
+    b = _roundtrip('npz', s, tmp_path)[0]
+    resumed = _sampler(back=b)
+    resumed.run_gibs(10)
+    assert len(resumed.backend.chain) == 50
+    assert np.array_equal(resumed.backend.get_attribute('steps'), np.arange(160, 210))
+
+
+def test_read_params(tmp_path):
+    s = _sampler()
+    s.run_gibs(100)
+    path = str(tmp_path / 'chains.npz')
+    export.to_npz(path, [s, s], chain_ids=[4, 7], metadata={'run': 'a'})
+    out = export.from_npz(path, params=['x2', 'x0'])
+    assert sorted(out) == [4, 7]
+    assert out[7].params == ['x2', 'x0']
+    assert np.array_equal(out[7].get_chain(), s.get_chain(params=['x2', 'x0']))
+    summary = out[4].get_summary()
+    assert np.allclose(summary['mean'][0], s.get_chain(params=['x2', 'x0']).mean(axis=0))
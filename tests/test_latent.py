@@ -0,0 +1,52 @@
+import numpy as np
+from gibbsPy import latent
+
+
+def _data(seed=0):
+    rs = np.random.RandomState(seed)
+    return np.concatenate((rs.normal(-2, 1, 300), rs.normal(2, 1, 300)))
+
+
+def _label_logp(pos, data):
+    return -0.5 * (data[:, None] - pos[None, :])**2
+
+
+def _conditional(pos, idx, data, labels=None, random=None):
+    # the mean of component idx given its data points, with a N(0, 10^2) prior
+    x = data[labels == idx]
+    precision = 0.01 + len(x)
+    return random.normal(x.sum() / precision, 1. / np.sqrt(precision))
+
+
+def _sampler(chunk=None):
+    return latent.LatentSampler(2, _label_logp, chunk=chunk, initial_state=np.array([-1., 1.]), data=_data(),
+                                cond_fct=_conditional, random=np.random.RandomState(1))
+
+
+def test_gumbel_max_frequencies():
+    logp = np.log([0.1, 0.2, 0.3, 0.4]) + 5.
+    draws = latent.gumbel_max(np.tile(logp, (200000, 1)), np.random.RandomState(0))
+    softmax = np.exp(logp - logp.max()) / np.sum(np.exp(logp - logp.max()))
+    freq = np.bincount(draws, minlength=4) / len(draws)
+    assert np.allclose(freq, softmax, atol=0.005)
+    assert draws.dtype == np.int32
+
+
+def test_chunked_labels_agree():
+    full = _sampler()
+    full.run_gibs(20)
+    chunked = _sampler(chunk=77)
+    chunked.run_gibs(20)
+    assert np.array_equal(full.labels, chunked.labels)
+    assert np.array_equal(full.get_chain(), chunked.get_chain())
+
+
+def test_labels_and_storage():
+    s = _sampler()
+    s.run_gibs(50)
+    assert s.labels.dtype == np.int32
+    assert s.labels.shape == (600,)
+    assert s._previous_state.labels is s.labels
+    # only the globals are stored
+    assert s.get_chain().shape == (50, 2)
+    assert np.allclose(np.sort(s.get_chain()[-10:].mean(axis=0)), [-2., 2.], atol=0.3)
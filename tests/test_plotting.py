@@ -0,0 +1,50 @@
+import numpy as np
+from gibbsPy import backend, state, utils
+
+
+def _chain(n=10007, seed=0):
+    return np.random.RandomState(seed).normal(size=(n, 3)) * [1., 2., 3.]
+
+
+def _backend(chain, **kwargs):
+    b = backend.Backend(**kwargs)
+    b.reset(chain.shape[1])
+    b.grow(len(chain))
+    for row in chain:
+        b.save_sample(state.State(row.copy()))
+    return b
+
+
+def test_chunked_histograms_match_numpy():
+    chain = _chain()
+    edges, counts, counts2d = utils.histograms(chain, bins=20, chunk=1000)
+    for i in range(3):
+        assert np.array_equal(edges[i][[0, -1]], [chain[:, i].min(), chain[:, i].max()])
+        assert np.array_equal(counts[i], np.histogram(chain[:, i], bins=edges[i])[0])
+        assert counts[i].sum() == len(chain)
+    H = np.histogram2d(chain[:, 0], chain[:, 2], bins=(edges[0], edges[2]))[0]
+    assert np.array_equal(counts2d[(0, 2)], H)
+
+
+def test_decimate_matches_reshape():
+    chain = _chain(n=10000)
+    starts, lo, hi = utils.decimate(chain, max_points=100, chunk=1234)
+    assert np.array_equal(starts, np.arange(0, 10000, 100))
+    assert np.array_equal(lo, chain.reshape(100, 100, 3).min(axis=1))
+    assert np.array_equal(hi, chain.reshape(100, 100, 3).max(axis=1))
+
+
+def test_decimate_partial_bucket():
+    chain = _chain(n=1050)
+    starts, lo, hi = utils.decimate(chain, max_points=10, chunk=300)
+    assert np.array_equal(starts, np.arange(0, 1050, 105))
+    assert np.array_equal(hi[-1], chain[945:].max(axis=0))
+
+
+def test_backend_and_array_agree():
+    chain = _chain()
+    for b in (_backend(chain, summary_block=1000), _backend(chain, summary_block=1000, max_blocks=2)):
+        for x, y in zip(utils.histograms(b, bins=15, chunk=999)[:2], utils.histograms(chain, bins=15, chunk=999)[:2]):
+            assert all(np.array_equal(u, v) for u, v in zip(x, y))
+        for x, y in zip(utils.decimate(b, max_points=50, chunk=999), utils.decimate(chain, max_points=50, chunk=999)):
+            assert np.array_equal(x, y)
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from gibbsPy import backend, sampler, state, storage
+
+
+def _backend(policy, n, grow=True):
+    b = backend.Backend(storage=policy, summary_block=7)
+    b.reset(2)
+    if grow:
+        b.grow(n)
+    for i in range(n):
+        b.save_sample(state.State(np.array([i, -i], dtype=float)))
+    return b
+
+
+def test_discard_and_thin():
+    b = _backend([storage.Discard(10), storage.Thin(3)], 40)
+    assert np.array_equal(b.get_chain()[:, 0], np.arange(12, 40, 3))
+    assert b.nsteps == 40
+    assert len(b.chain) == b.iteration == b.accepted
+
+
+@pytest.mark.parametrize('policies', [[storage.Discard(5)], [storage.Thin(4)], [storage.Discard(3), storage.Thin(2)]])
+def test_count_matches_accept(policies):
+    for n in (0, 1, 7, 20):
+        for policy in policies:
+            policy.reset()
+        expected = n
+        for policy in policies:
+            expected = policy.count(expected)
+        kept = 0
+        for _ in range(n):
+            kept += all(policy.accept() for policy in policies)
+        assert kept == expected
+
+
+def test_ring_buffer_keeps_last_in_order():
+    b = _backend(storage.RingBuffer(10), 25)
+    assert len(b.chain) == 10
+    assert np.array_equal(b.get_chain()[:, 0], np.arange(15, 25))
+    assert np.array_equal(b.get_chain(window=(2, 5), params=['x1'])[:, 0], -np.arange(17, 20))
+
+
+def test_reservoir_keeps_ordered_subset():
+    b = _backend(storage.Reservoir(10, random=0), 100)
+    kept = b.get_chain()[:, 0]
+    assert len(kept) == 10
+    assert np.all(np.diff(kept) > 0)
+    assert np.array_equal(b.get_attribute('steps'), kept.astype(int))
+
+
+def test_last_sample_of_filtered_backend():
+    b = _backend(storage.Thin(5), 12)
+    assert np.array_equal(b.get_last_sample().pos, [11., -11.])
+    assert b.iteration == 2
+    assert b.nsteps == 12
+
+
+def test_bounded_policy_must_be_last():
+    with pytest.raises(ValueError):
+        backend.Backend(storage=[storage.RingBuffer(5), storage.Thin(2)])
+
+
+def test_resume_with_policies():
+    def conditional(pos, idx, data, random=None):
+        return random.normal(pos[1 - idx], 1.)
+
+    full = sampler.Sampler(2, None, initial_state=np.zeros(2), cond_fct=conditional,
+                           random=np.random.RandomState(1), storage=[storage.Thin(2), storage.RingBuffer(20)])
+    full.run_gibs(100)
+
+    part = sampler.Sampler(2, None, initial_state=np.zeros(2), cond_fct=conditional,
+                           random=np.random.RandomState(1), storage=[storage.Thin(2), storage.RingBuffer(20)])
+    part.run_gibs(37)
+    resumed = sampler.Sampler(2, None, cond_fct=conditional, back=part.backend, resume=True)
+    resumed.run_gibs(63)
+    assert np.array_equal(resumed.get_chain(), full.get_chain())
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from gibbsPy import tempering
+
+GRID = np.linspace(-8., 8., 321)
+MODE = 4.
+
+
+def _log_prob(pos, data):
+    # two well separated gaussian modes at (MODE, MODE) and (-MODE, -MODE)
+    a = -0.5 * np.sum((pos - MODE)**2)
+    b = -0.5 * np.sum((pos + MODE)**2)
+    return np.logaddexp(a, b)
+
+
+def _conditional(pos, idx, data, beta=1., random=None):
+    # draw from the tempered conditional on a grid
+    x = np.repeat(np.asarray(pos, dtype=float)[None], len(GRID), axis=0)
+    x[:, idx] = GRID
+    logp = beta * np.logaddexp(-0.5 * np.sum((x - MODE)**2, axis=1), -0.5 * np.sum((x + MODE)**2, axis=1))
+    p = np.exp(logp - logp.max())
+    return random.choice(GRID, p=p / p.sum())
+
+
+def _sampler(**kwargs):
+    return tempering.TemperedSampler(2, log_prob=_log_prob, initial_state=np.full(2, MODE), cond_fct=_conditional,
+                                     random=np.random.RandomState(0), **kwargs)
+
+
+def test_visits_both_modes():
+    s = _sampler(betas=[1., 0.3, 0.1, 0.03])
+    s.run_gibs(1500)
+    x = s.get_chain()[:, 0]
+    assert 0.2 < np.mean(x > 0) < 0.8
+    assert np.all(s.swap_acceptance > 0)
+
+
+def test_adapted_ladder_stays_valid():
+    s = _sampler(ntemps=5, adapt_lag=100, adapt_time=10)
+    initial = np.copy(s.betas)
+    s.run_gibs(300)
+    assert s.betas[0] == 1.
+    assert s.betas[-1] == initial[-1]
+    assert np.all(np.diff(s.betas) < 0)
+    assert not np.allclose(s.betas, initial)
+
+
+def test_only_t1_is_stored():
+    s = _sampler(ntemps=3)
+    states = [np.copy(st.pos) for st in s.sample(s._previous_state, 50, store=True)]
+    chain = s.get_chain()
+    assert chain.shape == (50, 2)
+    assert np.array_equal(chain, states)
+    assert s.backend.nsteps == 50
+
+
+def test_resume_restarts_replicas_from_t1():
+    s = _sampler(ntemps=3)
+    s.run_gibs(20)
+    resumed = tempering.TemperedSampler(2, log_prob=_log_prob, cond_fct=_conditional, back=s.backend, resume=True,
+                                        betas=s.betas, adapt=False)
+    assert np.array_equal(resumed.betas, s.betas)
+    for pos in resumed._replicas:
+        assert np.array_equal(pos, s.get_chain()[-1])
+    resumed.run_gibs(5)
+    assert resumed.backend.iteration == 25
+
+
+def test_bad_ladder():
+    with pytest.raises(ValueError):
+        _sampler(betas=[1., 0.5, 0.7])